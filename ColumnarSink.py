@@ -0,0 +1,186 @@
+from array import array
+import asyncio
+import json
+import os
+
+import numpy as np
+
+#   Player record fields stored as fixed width numbers
+NUMERIC_FIELDS = {
+    "height": "i4",
+    "club_caps": "i4",
+    "club_conceded": "i4",
+    "club_scored": "i4",
+    "national_caps": "i4",
+    "national_conceded": "i4",
+    "national_scored": "i4",
+    "birth": "i8",
+    "tries": "i4",
+}
+
+#   Fields stored as int32 codes into a list of distinct values
+DICTIONARY_FIELDS = ["url", "name", "position", "current_club", "national_team"]
+
+_ARRAY_TYPECODES = {"i4": "i", "i8": "q"}
+
+
+def _hashable(value):
+    return tuple(value) if isinstance(value, list) else value
+
+
+class ColumnarSink:
+    """Player records as one .npy file per column.
+
+    Numeric fields become plain arrays with a boolean <field>.valid array
+    next to them, the rest are dictionary encoded: <field>.codes.npy holds
+    an index into <field>.values.json. Error records are only counted.
+    Columns grow in memory and the files are written on close().
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._rows = 0
+        self._errors = 0
+        self._numbers = {
+            field: array(_ARRAY_TYPECODES[dtype])
+            for field, dtype in NUMERIC_FIELDS.items()
+        }
+        self._valid = {field: bytearray() for field in NUMERIC_FIELDS}
+        self._codes = {field: array("i") for field in DICTIONARY_FIELDS}
+        self._dictionaries = {field: {} for field in DICTIONARY_FIELDS}
+
+    @classmethod
+    def from_records(cls, records, path):
+        sink = cls(path)
+        for record in records:
+            sink.write(record)
+        sink._save()
+        return sink
+
+    def write(self, item):
+        if "error" in item:
+            self._errors += 1
+            return
+
+        for field in NUMERIC_FIELDS:
+            value = item.get(field)
+            self._numbers[field].append(0 if value is None else value)
+            self._valid[field].append(value is not None)
+
+        for field in DICTIONARY_FIELDS:
+            dictionary = self._dictionaries[field]
+            value = _hashable(item.get(field))
+            code = dictionary.get(value)
+            if code is None:
+                code = dictionary[value] = len(dictionary)
+            self._codes[field].append(code)
+
+        self._rows += 1
+
+    def flush(self):
+        pass
+
+    async def close(self):
+        await asyncio.get_running_loop().run_in_executor(None, self._save)
+
+    def columns(self):
+        """(numbers, valid, codes, values) as arrays, the same ColumnarReader gives for the files"""
+        numbers = {
+            field: np.array(self._numbers[field], dtype=dtype)
+            for field, dtype in NUMERIC_FIELDS.items()
+        }
+        valid = {
+            field: np.frombuffer(bytes(self._valid[field]), dtype=bool)
+            for field in NUMERIC_FIELDS
+        }
+        codes = {field: np.array(self._codes[field], dtype="i4") for field in DICTIONARY_FIELDS}
+        values = {}
+        for field in DICTIONARY_FIELDS:
+            values[field] = np.empty(len(self._dictionaries[field]), dtype=object)
+            for value, code in self._dictionaries[field].items():
+                values[field][code] = list(value) if isinstance(value, tuple) else value
+        return numbers, valid, codes, values
+
+    def _save(self):
+        os.makedirs(self._path, exist_ok=True)
+        numbers, valid, codes, values = self.columns()
+
+        for field in NUMERIC_FIELDS:
+            np.save(os.path.join(self._path, f"{field}.npy"), numbers[field])
+            np.save(os.path.join(self._path, f"{field}.valid.npy"), valid[field])
+
+        for field in DICTIONARY_FIELDS:
+            np.save(os.path.join(self._path, f"{field}.codes.npy"), codes[field])
+            with open(
+                os.path.join(self._path, f"{field}.values.json"), "w", encoding="utf-8"
+            ) as f:
+                json.dump(list(values[field]), f, ensure_ascii=False)
+
+        with open(os.path.join(self._path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "rows": self._rows,
+                    "errors": self._errors,
+                    "numeric": NUMERIC_FIELDS,
+                    "dictionary": DICTIONARY_FIELDS,
+                },
+                f,
+            )
+
+
+class ColumnarReader:
+    """Memory mapped access to the columns written by ColumnarSink"""
+
+    def __init__(self, path):
+        self._path = path
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        self.rows = meta["rows"]
+        self.errors = meta["errors"]
+        self.numeric_fields = list(meta["numeric"])
+        self.dictionary_fields = list(meta["dictionary"])
+        self._values = {}
+
+    def _load(self, name):
+        return np.load(os.path.join(self._path, name), mmap_mode="r")
+
+    def column(self, field):
+        """Numeric column as an array, dictionary column as its codes"""
+        if field in self.dictionary_fields:
+            return self._load(f"{field}.codes.npy")
+        return self._load(f"{field}.npy")
+
+    def valid(self, field):
+        return self._load(f"{field}.valid.npy")
+
+    def values(self, field):
+        """Distinct values of a dictionary encoded column, indexed by code"""
+        if field not in self._values:
+            with open(
+                os.path.join(self._path, f"{field}.values.json"), encoding="utf-8"
+            ) as f:
+                values = json.load(f)
+            decoded = np.empty(len(values), dtype=object)
+            for code, value in enumerate(values):
+                decoded[code] = value
+            self._values[field] = decoded
+        return self._values[field]
+
+    def decode(self, field, rows=None):
+        codes = self.column(field)
+        if rows is not None:
+            codes = codes[rows]
+        return self.values(field)[codes]
+
+
+if __name__ == "__main__":
+    import sys
+
+    from FileSink import FileSink
+
+    if len(sys.argv) != 3:
+        raise ValueError(f"Usage: {sys.argv[0]} <path to jsonl result> <output directory>")
+
+    ColumnarSink.from_records(FileSink.read(sys.argv[1]), sys.argv[2])
+    reader = ColumnarReader(sys.argv[2])
+    print(f"{reader.rows} records, {reader.errors} errors")
@@ -0,0 +1,118 @@
+import asyncio
+import time
+
+from RetryScheduler import HTTP_RETRYABLE, NETWORK, classify
+
+
+class _Slot:
+    def __init__(self, controller):
+        self._controller = controller
+        self._start_ts = None
+
+    async def __aenter__(self):
+        await self._controller.acquire()
+        self._start_ts = time.monotonic()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        #   Timeouts, connection errors and 5xx / 429 mean the server is overloaded, a 404 does not
+        error = exc is not None and classify(exc) in (NETWORK, HTTP_RETRYABLE)
+        self._controller.observe(time.monotonic() - self._start_ts, error)
+        await self._controller.release()
+
+
+class ConcurrencyController:
+    """Number of parallel downloads adjusted by AIMD.
+
+    Downloads hold a slot (async with controller.slot()) and report how
+    long they took and whether the server failed them. Once limit of them
+    finished the window is decided: any timeout, connection error or
+    5xx / 429 halves it, a p95 latency above latency_tolerance times the
+    best p95 seen so far (and latency_slack seconds more than it) cuts it
+    by a fifth, otherwise it grows by one.
+    It starts at min_limit and doubles until the first backoff. Every
+    decision is logged. With min_limit == max_limit it is a semaphore.
+    """
+
+    def __init__(
+        self,
+        min_limit,
+        max_limit,
+        latency_tolerance=2.0,
+        latency_slack=0.05,
+        min_samples=8,
+        logger=None,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = min_limit
+        self._latency_tolerance = latency_tolerance
+        self._latency_slack = latency_slack
+        self._min_samples = min_samples
+        self._logger = logger.getChild("ConcurrencyController") if logger else None
+
+        self._in_use = 0
+        self._condition = asyncio.Condition()
+        self._slow_start = True
+        self._baseline = None
+        self._latencies = []
+        self._errors = 0
+
+    @property
+    def in_use(self):
+        return self._in_use
+
+    def slot(self):
+        return _Slot(self)
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._in_use < self.limit)
+            self._in_use += 1
+
+    async def release(self):
+        async with self._condition:
+            self._in_use -= 1
+            if len(self._latencies) >= max(self.limit, self._min_samples):
+                self._decide()
+            self._condition.notify(max(0, self.limit - self._in_use))
+
+    def observe(self, seconds, error=False):
+        if self.min_limit == self.max_limit:
+            return
+        self._latencies.append(seconds)
+        if error:
+            self._errors += 1
+
+    def _decide(self):
+        latencies = sorted(self._latencies)
+        p95 = latencies[int(0.95 * (len(latencies) - 1))]
+        errors = self._errors
+        self._latencies = []
+        self._errors = 0
+
+        old = self.limit
+        if errors:
+            self._slow_start = False
+            self.limit = max(self.min_limit, self.limit // 2)
+            reason = f"{errors} errors"
+        elif self._baseline is not None and p95 > max(
+            self._latency_tolerance * self._baseline, self._baseline + self._latency_slack
+        ):
+            self._slow_start = False
+            self.limit = max(self.min_limit, int(self.limit * 0.8))
+            reason = f"p95 {p95 * 1000:.0f}ms over {self._latency_tolerance} x {self._baseline * 1000:.0f}ms"
+        else:
+            if self._baseline is None or p95 < self._baseline:
+                self._baseline = p95
+            else:
+                #   Let the baseline follow a network that got slower for good
+                self._baseline += (p95 - self._baseline) / 10
+            step = self.limit if self._slow_start else 1
+            self.limit = min(self.max_limit, self.limit + step)
+            reason = f"healthy, p95 {p95 * 1000:.0f}ms"
+
+        if self._logger is not None:
+            self._logger.info(
+                f"Parallel downloads {old} -> {self.limit}: {reason} in {len(latencies)} downloads"
+            )
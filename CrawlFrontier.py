@@ -0,0 +1,93 @@
+import json
+import sqlite3
+import time
+
+
+class CrawlFrontier:
+    """Crawl state checkpointed to an SQLite file.
+
+    Every URL the runner touches is stored with its state and number of
+    tries. Updates are buffered and written in one transaction once
+    batch_size of them piled up or flush_interval seconds passed. take()
+    and write() split a flush so the commit can run in another thread.
+    """
+
+    DISCOVERED = "discovered"
+    IN_FLIGHT = "in_flight"
+    DONE = "done"
+    FAILED = "failed"
+
+    def __init__(self, path, batch_size=200, flush_interval=1.0, reset=False):
+        #   write() may run in an executor thread, never two at once
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, state TEXT NOT NULL, tries INTEGER NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+        if reset:
+            self._db.execute("DELETE FROM urls")
+            self._db.execute("DELETE FROM state")
+        self._db.commit()
+
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._pending = {}
+        self._pending_state = {}
+        self._last_flush_ts = time.monotonic()
+
+    def load(self):
+        """Return {url: (state, tries)} for everything checkpointed so far"""
+        return {
+            url: (state, tries)
+            for url, state, tries in self._db.execute(
+                "SELECT url, state, tries FROM urls"
+            )
+        }
+
+    def load_state(self, key, default=None):
+        row = self._db.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def record(self, url, state, tries):
+        self._pending[url] = (state, tries)
+
+    def record_state(self, key, value):
+        """Save JSON serializable value along with the next batch"""
+        self._pending_state[key] = json.dumps(value, ensure_ascii=False)
+
+    def should_flush(self):
+        return len(self._pending) >= self._batch_size or (
+            len(self._pending) > 0
+            and time.monotonic() - self._last_flush_ts >= self._flush_interval
+        )
+
+    def take(self):
+        """Return the buffered updates for write() and start a new batch"""
+        batch = (self._pending, self._pending_state)
+        self._pending = {}
+        self._pending_state = {}
+        self._last_flush_ts = time.monotonic()
+        return batch
+
+    def write(self, batch):
+        pending, pending_state = batch
+        if not pending and not pending_state:
+            return
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO urls (url, state, tries) VALUES (?, ?, ?)",
+                [(url, state, tries) for url, (state, tries) in pending.items()],
+            )
+            self._db.executemany(
+                "INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)",
+                list(pending_state.items()),
+            )
+
+    def flush(self):
+        self.write(self.take())
+
+    def close(self):
+        self.flush()
+        self._db.close()
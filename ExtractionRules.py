@@ -0,0 +1,126 @@
+import hashlib
+import json
+import re
+
+#   Russian Wikipedia edition. Infobox fields are listed by priority: a
+#   header matching several labels goes to the first of them.
+DEFAULT_RULES = {
+    "page_kinds": {
+        "Соревнование футбольных сборных": "main_page",
+        "Сборная страны по футболу": "team",
+        "Футболист": "player",
+    },
+    "infobox_fields": {
+        "birth": "Родился",
+        "height": "Рост",
+        "position": "Позиция",
+        "current_club": "Клуб",
+        "club_career": "Клубная карьера",
+        "national_career": "Национальная сборная",
+    },
+    "months": [
+        "января",
+        "февраля",
+        "марта",
+        "апреля",
+        "мая",
+        "июня",
+        "июля",
+        "августа",
+        "сентября",
+        "октября",
+        "ноября",
+        "декабря",
+    ],
+    "sections": {
+        "qualified_teams": ["Квалифицировались_в_финальный_турнир"],
+        "squad": [
+            "Текущий_состав",
+            "Текущий_состав_сборной",
+            "Состав",
+            "Состав_сборной",
+            "Недавние_вызовы",
+        ],
+        "club_stats": [
+            "Клубная_статистика",
+            "Статистика_выступлений",
+            "Клубная",
+            "Статистика",
+        ],
+        "national_stats": ["Статистика_в_сборной", "Матчи_за_сборную"],
+    },
+    "totals": {
+        "club": ["Всего за карьеру", "Всего"],
+        "national": ["Итого"],
+    },
+    "goalkeeper": "вратарь",
+    #   Class of the div with the player name in the infobox header
+    "player_name_class": "ts_Спортсмен_имя",
+}
+
+
+class ExtractionRules:
+    """Labels, section ids and month names the parsers look for.
+
+    All infobox labels are compiled into one regex, so a header is matched
+    once whatever the number of fields, and the result is cached per
+    header text. Months map to their numbers with a dict.
+    """
+
+    def __init__(self, rules=None):
+        if rules is None:
+            rules = DEFAULT_RULES
+        self._source = rules
+
+        self.page_kinds = dict(rules["page_kinds"])
+        self.months = {month: i for i, month in enumerate(rules["months"], 1)}
+        self.sections = {name: list(ids) for name, ids in rules["sections"].items()}
+        self.club_totals = set(rules["totals"]["club"])
+        self.national_totals = set(rules["totals"]["national"])
+        self.goalkeeper = rules["goalkeeper"]
+        self.player_name_class = rules["player_name_class"]
+
+        self._fields = list(rules["infobox_fields"])
+        self._header_regex = re.compile(
+            "|".join(
+                rf"(\b{re.escape(label)}\b)"
+                for label in rules["infobox_fields"].values()
+            )
+        )
+        self._header_fields = {}
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def __getstate__(self):
+        return self._source
+
+    def __setstate__(self, rules):
+        self.__init__(rules)
+
+    def page_kind(self, data_name):
+        for marker, kind in self.page_kinds.items():
+            if marker in data_name:
+                return kind
+        return None
+
+    def infobox_field(self, header):
+        """Field of an infobox row with this header text, None for other rows"""
+        field = self._header_fields.get(header, False)
+        if field is False:
+            matches = [match.lastindex - 1 for match in self._header_regex.finditer(header)]
+            field = self._fields[min(matches)] if matches else None
+            self._header_fields[header] = field
+        return field
+
+    def fingerprint(self):
+        return hashlib.sha256(
+            json.dumps(self._source, ensure_ascii=False, sort_keys=True).encode()
+        ).hexdigest()
+
+
+if __name__ == "__main__":
+    #   Starting point for a rules file of another edition
+    print(json.dumps(DEFAULT_RULES, ensure_ascii=False, indent=4))
@@ -1,11 +1,233 @@
+import asyncio
+import gzip
+import io
 import json
+import os
+import queue
+import threading
+import time
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def _dumps(item):
+    if orjson is not None:
+        return orjson.dumps(item, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(item, ensure_ascii=False) + "\n").encode()
+
+
+def _open(path, mode, compression):
+    if compression is None:
+        return open(path, mode)
+    if compression == "gzip":
+        return gzip.open(path, mode)
+    if compression == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstd compression needs the zstandard package")
+        raw = open(path, mode)
+        if "r" in mode:
+            #   The zstd reader can't iterate over lines, the buffered wrapper can
+            return io.BufferedReader(
+                zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+            )
+        return zstandard.ZstdCompressor().stream_writer(raw, closefd=True)
+    raise ValueError(f"Unknown compression {compression}")
+
+
+def _parts(path):
+    """Existing files of the output: path, path.1, path.2, ..."""
+    parts = []
+    while True:
+        part = path if not parts else f"{path}.{len(parts)}"
+        if not os.path.exists(part):
+            return parts
+        parts.append(part)
+
+
+_FLUSH = object()
+_CLOSE = object()
+
 
 class FileSink:
-    def __init__(self, path):
-        self._file = open(path, "w", encoding="utf-8")
+    """JSON lines output written by a background thread.
+
+    write() only puts the record into a queue. The writer thread encodes
+    records (with orjson when it is installed) and writes them in batches
+    of batch_size; whatever is buffered goes to disk at least every
+    flush_interval seconds. With max_bytes set the output is split into
+    path, path.1, path.2, ... of about that size each. close() has to be
+    awaited to get every record on disk.
+    """
+
+    def __init__(
+        self,
+        path,
+        append=False,
+        batch_size=256,
+        flush_interval=1.0,
+        max_bytes=None,
+        compression=None,
+    ):
+        self._path = path
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._max_bytes = max_bytes
+        self._compression = compression
+
+        parts = _parts(path) if append else []
+        if compression is not None and parts:
+            #   A compressed stream can't be continued after a crash, start a new part
+            self._part_index = len(parts)
+            self._file = _open(self._part_path(), "wb", compression)
+        else:
+            self._part_index = max(len(parts) - 1, 0)
+            self._file = _open(self._part_path(), "ab" if append else "wb", compression)
+        self._part_size = 0
+        self._dirty = False
+
+        self._queue = queue.Queue()
+        self._error = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="FileSink", daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def recover(path, compression=None):
+        """Drop a half written last line and return urls of the records in the output"""
+        urls = set()
+        for part in _parts(path):
+            valid_size = 0
+            with _open(part, "rb", compression) as f:
+                try:
+                    for line in f:
+                        if not line.endswith(b"\n"):
+                            break
+                        urls.add(json.loads(line)["url"])
+                        valid_size += len(line)
+                except (EOFError, ValueError, KeyError, OSError):
+                    pass
+
+            if compression is None and valid_size != os.path.getsize(part):
+                with open(part, "r+b") as f:
+                    f.truncate(valid_size)
+
+        return urls
+
+    @staticmethod
+    def read(path, compression=None):
+        """Yield the records of an output written by FileSink"""
+        for part in _parts(path):
+            with _open(part, "rb", compression) as f:
+                for line in f:
+                    yield json.loads(line)
+
+    @staticmethod
+    def remove(path):
+        """Delete every part of an output"""
+        for part in _parts(path):
+            os.remove(part)
+
+    def _part_path(self):
+        if self._part_index == 0:
+            return self._path
+        return f"{self._path}.{self._part_index}"
 
     def write(self, item):
-        self._file.write(json.dumps(item, ensure_ascii=False) + "\n")
+        if self._error is not None:
+            raise self._error
+        if self._closed:
+            raise RuntimeError("Write to a closed sink")
+        self._queue.put(item)
+
+    def flush(self):
+        """Block until everything written so far is on disk"""
+        done = threading.Event()
+        self._queue.put((_FLUSH, done))
+        done.wait()
+        if self._error is not None:
+            raise self._error
+
+    async def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put((_CLOSE, None))
+        await asyncio.get_running_loop().run_in_executor(None, self._thread.join)
+        if self._error is not None:
+            raise self._error
+
+    def _run(self):
+        batch = []
+        last_flush_ts = time.monotonic()
+
+        while True:
+            timeout = max(self._flush_interval - (time.monotonic() - last_flush_ts), 0)
+            try:
+                message = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                message = None
+
+            try:
+                if isinstance(message, tuple) and message[0] is _CLOSE:
+                    self._write_batch(batch)
+                    self._file.close()
+                    return
+
+                if isinstance(message, tuple) and message[0] is _FLUSH:
+                    self._write_batch(batch)
+                    self._sync()
+                    last_flush_ts = time.monotonic()
+                    message[1].set()
+                    continue
+
+                if message is not None:
+                    batch.append(_dumps(message))
+                    if len(batch) < self._batch_size:
+                        continue
+
+                self._write_batch(batch)
+                if message is None:
+                    self._sync()
+                    last_flush_ts = time.monotonic()
+            except Exception as e:
+                self._error = e
+                if isinstance(message, tuple) and message[1] is not None:
+                    message[1].set()
+                if isinstance(message, tuple) and message[0] is _CLOSE:
+                    return
+
+    def _write_batch(self, batch):
+        if not batch:
+            return
+        data = b"".join(batch)
+        batch.clear()
+        self._file.write(data)
+        self._part_size += len(data)
+        self._dirty = True
+
+        if self._max_bytes is not None and self._part_size >= self._max_bytes:
+            self._file.close()
+            self._dirty = False
+            self._part_index += 1
+            self._part_size = 0
+            self._file = _open(self._part_path(), "wb", self._compression)
 
-    def __del__(self):
-        self._file.close()
+    def _sync(self):
+        if not self._dirty:
+            return
+        self._dirty = False
+        self._file.flush()
+        raw = getattr(self._file, "fileno", None)
+        if raw is not None:
+            try:
+                os.fsync(raw())
+            except (OSError, ValueError):
+                pass
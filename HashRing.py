@@ -0,0 +1,29 @@
+import bisect
+import hashlib
+
+
+def _hash(key):
+    #   Python's hash() differs between processes, the ring has to agree across them
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent hash ring of shard ids.
+
+    Every shard is placed on the ring replicas times, a key belongs to the
+    first shard point at or after its hash. Adding a shard moves only the
+    keys that land on its points.
+    """
+
+    def __init__(self, shards, replicas=100):
+        points = sorted(
+            (_hash(f"{shard}:{replica}"), shard)
+            for shard in range(shards)
+            for replica in range(replicas)
+        )
+        self._hashes = [point for point, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    def owner(self, key):
+        i = bisect.bisect_left(self._hashes, _hash(key))
+        return self._shards[i % len(self._shards)]
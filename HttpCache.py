@@ -0,0 +1,139 @@
+from collections import OrderedDict
+import gzip
+import hashlib
+import json
+import os
+import time
+
+
+class CacheMiss(Exception):
+    pass
+
+
+class HttpCache:
+    """Gzipped response bodies on disk keyed by request url.
+
+    Each entry is a pair of files: <key>.gz with the body and <key>.json
+    with the final url, charset, validators (ETag / Last-Modified) and the
+    time it was stored. Entries younger than ttl seconds are served as is,
+    older ones are revalidated with a conditional request. Once the bodies
+    take more than max_size bytes the least recently used entries go away.
+    With offline set the network is never used and a miss is an error.
+    """
+
+    def __init__(self, path, ttl=24 * 3600, max_size=1024**3, offline=False):
+        self._path = path
+        self._ttl = ttl
+        self._max_size = max_size
+        self.offline = offline
+
+        os.makedirs(path, exist_ok=True)
+
+        #   key -> body size, least recently used first
+        self._entries = OrderedDict()
+        self._size = 0
+
+        found = []
+        for name in os.listdir(path):
+            if not name.endswith(".json"):
+                continue
+            key = name[: -len(".json")]
+            try:
+                stat = os.stat(self._body_path(key))
+            except FileNotFoundError:
+                os.remove(os.path.join(path, name))
+                continue
+            found.append((stat.st_mtime, key, stat.st_size))
+
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._size += size
+
+    def _key(self, url):
+        return hashlib.sha256(url.encode()).hexdigest()
+
+    def _body_path(self, key):
+        return os.path.join(self._path, key + ".gz")
+
+    def _meta_path(self, key):
+        return os.path.join(self._path, key + ".json")
+
+    def _write(self, path, data):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def lookup(self, url):
+        """Return the stored metadata for url or None"""
+        key = self._key(url)
+        if key not in self._entries:
+            return None
+        try:
+            with open(self._meta_path(key), encoding="utf-8") as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self._evict(key)
+            return None
+
+        self._entries.move_to_end(key)
+        os.utime(self._body_path(key))
+        return meta
+
+    def is_fresh(self, meta):
+        return time.time() - meta["stored_at"] < self._ttl
+
+    def conditional_headers(self, meta):
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def body(self, meta):
+        """Return the cached body as sent, encoded in meta["charset"]"""
+        with open(self._body_path(self._key(meta["url"])), "rb") as f:
+            return gzip.decompress(f.read())
+
+    def store(self, url, body, final_url, charset, headers):
+        key = self._key(url)
+        compressed = gzip.compress(body, compresslevel=5)
+
+        self._write(self._body_path(key), compressed)
+        self._write_meta(
+            key,
+            {
+                "url": url,
+                "final_url": final_url,
+                "charset": charset,
+                "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+                "stored_at": time.time(),
+            },
+        )
+
+        self._size += len(compressed) - self._entries.pop(key, 0)
+        self._entries[key] = len(compressed)
+        while self._size > self._max_size and len(self._entries) > 1:
+            self._evict(next(iter(self._entries)))
+
+    def revalidated(self, meta, headers):
+        """Server answered 304: the body is still good, restart its ttl"""
+        meta["stored_at"] = time.time()
+        meta["etag"] = headers.get("ETag", meta.get("etag"))
+        meta["last_modified"] = headers.get("Last-Modified", meta.get("last_modified"))
+        self._write_meta(self._key(meta["url"]), meta)
+
+    def _write_meta(self, key, meta):
+        self._write(
+            self._meta_path(key), json.dumps(meta, ensure_ascii=False).encode()
+        )
+
+    def _evict(self, key):
+        self._size -= self._entries.pop(key, 0)
+        for path in (self._meta_path(key), self._body_path(key)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
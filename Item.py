@@ -1,5 +1,15 @@
 class Item:
-    def __init__(self, url, tries=0):
+    #   One instance per queued url, slots keep them small on big crawls
+    __slots__ = ("url", "start", "queued_ts", "timings", "tries", "depth", "redirect_url")
+
+    def __init__(self, url, tries=0, depth=0):
         self.url = url
         self.start = None
+        self.queued_ts = None
+        #   Stage durations of the current attempt, see Metrics
+        self.timings = None
         self.tries = tries
+        #   Number of links followed from a seed url
+        self.depth = depth
+        #   Canonical url a redirect led to, claimed in the runner's seen set
+        self.redirect_url = None
@@ -0,0 +1,189 @@
+from urllib.parse import quote, urlsplit
+import asyncio
+import mmap
+import os
+import tarfile
+import time
+import zipfile
+
+from canonical_url import canonicalize
+
+PAGE_SUFFIX = ".html"
+
+
+class LocalCorpus:
+    """Saved pages in a directory, a tar (plain or compressed) or a zip file.
+
+    Every <name>.html file, at any depth, is the page of the article name.
+    Files of a directory are memory mapped, so reading one costs nothing
+    until the parser touches it; archive members are read into bytes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._files = {}
+        self._archive = None
+
+        if os.path.isdir(path):
+            for directory, _, file_names in os.walk(path):
+                for file_name in file_names:
+                    if file_name.endswith(PAGE_SUFFIX):
+                        self._files[file_name[: -len(PAGE_SUFFIX)]] = os.path.join(
+                            directory, file_name
+                        )
+        elif zipfile.is_zipfile(path):
+            self._archive = zipfile.ZipFile(path)
+            for info in self._archive.infolist():
+                if not info.is_dir() and info.filename.endswith(PAGE_SUFFIX):
+                    self._files[_page_name(_zip_member_name(info))] = info
+        elif tarfile.is_tarfile(path):
+            self._archive = tarfile.open(path)
+            for info in self._archive.getmembers():
+                if info.isfile() and info.name.endswith(PAGE_SUFFIX):
+                    self._files[_page_name(info.name)] = info
+        else:
+            raise ValueError(f"{path} is not a directory, tar or zip file")
+
+    def __len__(self):
+        return len(self._files)
+
+    def __contains__(self, name):
+        return name in self._files
+
+    def names(self):
+        return list(self._files)
+
+    def read(self, name):
+        """Bytes of the page, an mmap for files of a directory"""
+        entry = self._files[name]
+        if isinstance(entry, zipfile.ZipInfo):
+            return self._archive.read(entry)
+        if isinstance(entry, tarfile.TarInfo):
+            return self._archive.extractfile(entry).read()
+        with open(entry, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b""
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        if self._archive is not None:
+            self._archive.close()
+
+
+def _zip_member_name(info):
+    #   Without the UTF-8 flag zipfile decodes names as cp437, but most tools write UTF-8 anyway
+    if info.flag_bits & 0x800:
+        return info.filename
+    try:
+        return info.filename.encode("cp437").decode("utf-8")
+    except UnicodeError:
+        return info.filename
+
+
+def _page_name(member_name):
+    return member_name.rsplit("/", 1)[-1][: -len(PAGE_SUFFIX)]
+
+
+def page_url(site, name):
+    """Url the page of the article name has on site (scheme://host)"""
+    return canonicalize(f"{site}/wiki/{quote(name, safe='/,()')}")
+
+
+class CorpusPageParser:
+    """Parser taking page names of a LocalCorpus instead of page bytes.
+
+    Goes through the parse executors like the wrapped parser, so with a
+    process pool every worker opens the corpus and maps the pages itself,
+    only names and results cross the process boundary.
+    """
+
+    def __init__(self, parser, corpus_path):
+        self._parser = parser
+        self._corpus_path = corpus_path
+        self._corpus = None
+        self.rules = parser.rules
+
+    @property
+    def teams(self):
+        return self._parser.teams
+
+    @teams.setter
+    def teams(self, teams):
+        self._parser.teams = teams
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_corpus"] = None
+        return state
+
+    def parse(self, name, current_url, encoding=None):
+        if self._corpus is None:
+            self._corpus = LocalCorpus(self._corpus_path)
+        content = self._corpus.read(name)
+        try:
+            return self._parser.parse(content, current_url, encoding)
+        finally:
+            if isinstance(content, mmap.mmap):
+                content.close()
+
+
+class CorpusRunner:
+    """Parses a LocalCorpus the way AsyncRunner crawls the site, without HTTP.
+
+    Starts at the page of seed_url and follows links to pages of the same
+    site found in the corpus, level by level, so the teams of the
+    tournament page are known before any player page is parsed. Records go
+    to the sink as the crawl writes them.
+    """
+
+    def __init__(self, parser, sink, logger, corpus, seed_url, parse_executor):
+        self._logger = logger.getChild("CorpusRunner")
+        self._sink = sink
+        self._corpus = corpus
+        self._parse_executor = parse_executor
+
+        self._seed_url = canonicalize(seed_url)
+        parts = urlsplit(self._seed_url)
+        site = f"{parts.scheme}://{parts.netloc}"
+        self._names = {page_url(site, name): name for name in corpus.names()}
+
+    async def run(self):
+        start = time.monotonic()
+        pages = errors = 0
+        try:
+            if self._seed_url not in self._names:
+                raise ValueError(f"{self._seed_url} is not in {self._corpus.path}")
+
+            seen = {self._seed_url}
+            level = [self._seed_url]
+            while level:
+                parsed = await asyncio.gather(*(self._parse(url) for url in level))
+                level = []
+                for url, result, urls, error in parsed:
+                    if error is not None:
+                        errors += 1
+                        self._sink.write({"error": error, "url": url, "tries": 1})
+                        continue
+                    pages += 1
+                    if result is not None:
+                        result["tries"] = 0
+                        self._sink.write(result)
+                    for link in urls:
+                        link = canonicalize(link)
+                        if link in self._names and link not in seen:
+                            seen.add(link)
+                            level.append(link)
+        finally:
+            await self._sink.close()
+        self._logger.info(
+            f"Parsed {pages} pages ({errors} errors) of {len(self._names)} in the corpus "
+            f"in {time.monotonic() - start:.2f}s"
+        )
+
+    async def _parse(self, url):
+        try:
+            result, urls = await self._parse_executor.parse(self._names[url], url)
+        except Exception as e:
+            self._logger.warning(f"Fail: {url} {e}")
+            return url, None, [], str(e)
+        return url, result, urls, None
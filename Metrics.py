@@ -0,0 +1,184 @@
+from collections import Counter
+import asyncio
+import bisect
+import json
+import time
+
+import aiohttp
+from aiohttp import web
+
+#   Stages of a page, in the order they happen
+STAGES = ("queue_wait", "rate_limit", "connect", "ttfb", "body", "parse", "sink_write")
+
+#   Upper bounds (seconds) of the histogram buckets
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class _Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile"""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class Metrics:
+    """Timers, counters and gauges of a crawl.
+
+    observe() adds a stage duration (monotonic seconds) to the stage
+    histogram and to the timings of the page. Gauges are functions read
+    when a summary is made. Optionally a summary is logged every
+    summary_interval seconds, the Prometheus text format is served on
+    127.0.0.1:prometheus_port/metrics and every page attempt is appended
+    to trace_path as a JSON line.
+    """
+
+    def __init__(
+        self, logger=None, summary_interval=None, prometheus_port=None, trace_path=None
+    ):
+        self._logger = logger.getChild("Metrics") if logger is not None else None
+        self._summary_interval = summary_interval
+        self._prometheus_port = prometheus_port
+        self._trace_path = trace_path
+
+        self.timers = {stage: _Histogram() for stage in STAGES}
+        self.counters = Counter()
+        self._gauges = {}
+
+        self._trace_file = None
+        self._summary_task = None
+        self._server = None
+
+    def observe(self, stage, seconds, timings=None):
+        self.timers[stage].observe(seconds)
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0) + seconds
+
+    def inc(self, name, value=1):
+        self.counters[name] += value
+
+    def gauge(self, name, func):
+        self._gauges[name] = func
+
+    def gauges(self):
+        return {name: func() for name, func in self._gauges.items()}
+
+    def trace_config(self):
+        """Connect and time to first byte of requests made with trace_request_ctx=timings"""
+
+        async def on_request_start(session, ctx, params):
+            ctx.sent_ts = time.monotonic()
+
+        async def on_connection_create_start(session, ctx, params):
+            ctx.connect_ts = time.monotonic()
+
+        async def on_connection_create_end(session, ctx, params):
+            ctx.sent_ts = time.monotonic()
+            self.observe("connect", ctx.sent_ts - ctx.connect_ts, ctx.trace_request_ctx)
+
+        async def on_connection_reuseconn(session, ctx, params):
+            ctx.sent_ts = time.monotonic()
+
+        async def on_request_end(session, ctx, params):
+            self.observe("ttfb", time.monotonic() - ctx.sent_ts, ctx.trace_request_ctx)
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_connection_create_start.append(on_connection_create_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace_config.on_request_end.append(on_request_end)
+        return trace_config
+
+    def trace(self, record):
+        if self._trace_file is not None:
+            self._trace_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def summary(self):
+        counters = ", ".join(f"{name} {value}" for name, value in sorted(self.counters.items()))
+        gauges = ", ".join(f"{name} {value}" for name, value in self.gauges().items())
+        timers = ", ".join(
+            f"{stage} {timer.total / timer.count * 1000:.1f}/{timer.quantile(0.95) * 1000:.0f}ms"
+            for stage, timer in self.timers.items()
+            if timer.count
+        )
+        return f"{counters}; {gauges}; mean/p95: {timers}"
+
+    def prometheus(self):
+        lines = [
+            "# HELP crawler_stage_seconds Time spent by pages in each stage",
+            "# TYPE crawler_stage_seconds histogram",
+        ]
+        for stage, timer in self.timers.items():
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), timer.counts):
+                cumulative += count
+                lines.append(
+                    f'crawler_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}'
+                )
+            lines.append(f'crawler_stage_seconds_sum{{stage="{stage}"}} {timer.total}')
+            lines.append(f'crawler_stage_seconds_count{{stage="{stage}"}} {timer.count}')
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"# TYPE crawler_{name}_total counter")
+            lines.append(f"crawler_{name}_total {value}")
+        for name, value in self.gauges().items():
+            lines.append(f"# TYPE crawler_{name} gauge")
+            lines.append(f"crawler_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    async def start(self):
+        if self._trace_path is not None:
+            self._trace_file = open(self._trace_path, "a", encoding="utf-8")
+        if self._summary_interval and self._logger is not None:
+            self._summary_task = asyncio.ensure_future(self._log_summaries())
+        if self._prometheus_port is not None:
+            await self._serve()
+
+    async def stop(self):
+        if self._summary_task is not None:
+            self._summary_task.cancel()
+            await asyncio.gather(self._summary_task, return_exceptions=True)
+            self._summary_task = None
+        if self._server is not None:
+            await self._server.cleanup()
+            self._server = None
+        if self._trace_file is not None:
+            self._trace_file.close()
+            self._trace_file = None
+        if self._logger is not None:
+            self._logger.info(f"Summary: {self.summary()}")
+
+    async def _log_summaries(self):
+        while True:
+            await asyncio.sleep(self._summary_interval)
+            self._logger.info(f"Summary: {self.summary()}")
+
+    async def _serve(self):
+        async def handle(request):
+            return web.Response(text=self.prometheus(), content_type="text/plain")
+
+        app = web.Application()
+        app.router.add_get("/metrics", handle)
+        self._server = web.AppRunner(app, access_log=None)
+        await self._server.setup()
+        await web.TCPSite(self._server, "127.0.0.1", self._prometheus_port).start()
+        if self._logger is not None:
+            self._logger.info(
+                f"Serving metrics on http://127.0.0.1:{self._prometheus_port}/metrics"
+            )
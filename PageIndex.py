@@ -0,0 +1,103 @@
+import bisect
+
+from bs4 import Tag
+
+
+def has_class(tag, name):
+    """Same as bs4 {"class": name}: one of the classes or the whole class attribute"""
+    classes = tag.get("class") or ()
+    return name in classes or " ".join(classes) == name
+
+
+class PageIndex:
+    """Lookups of the extractors, collected in one walk over the soup.
+
+    Holds the first element with every id (and with every tag name and
+    id, as find(name, id=...) would find it), all tables in document order
+    (so the table following a section anchor is a bisect away), the rows
+    of every table as find_all("tr") would return them, the first th of
+    every row and the first table.infobox.
+    """
+
+    def __init__(self, soup):
+        self.soup = soup
+        self.ids = {}
+        self.infobox = None
+        self._named_ids = {}
+
+        self._positions = {}
+        self._table_positions = []
+        self._tables = []
+        self._rows = {}
+        self._headers = {}
+
+        self._visit(soup)
+
+    def _visit(self, soup):
+        #   Iterative, deeply nested markup would overflow the recursion limit
+        count = 0
+        open_tables = []
+        open_rows = []
+        #   (children left to visit, open_tables / open_rows to pop when done)
+        stack = [(iter(soup.contents), None)]
+        while stack:
+            children, opened = stack[-1]
+            tag = next(children, None)
+            if tag is None:
+                stack.pop()
+                if opened is not None:
+                    opened.pop()
+                continue
+            if not isinstance(tag, Tag):
+                continue
+
+            count += 1
+            element_id = tag.get("id")
+            if element_id is not None:
+                if element_id not in self.ids:
+                    self.ids[element_id] = tag
+                    self._positions[element_id] = count
+                self._named_ids.setdefault((tag.name, element_id), tag)
+
+            name = tag.name
+            opened = None
+            if name == "table":
+                self._table_positions.append(count)
+                self._tables.append(tag)
+                self._rows[id(tag)] = []
+                if self.infobox is None and has_class(tag, "infobox"):
+                    self.infobox = tag
+                open_tables.append(tag)
+                opened = open_tables
+            elif name == "tr":
+                for table in open_tables:
+                    self._rows[id(table)].append(tag)
+                open_rows.append(tag)
+                opened = open_rows
+            elif name == "th":
+                for row in open_rows:
+                    self._headers.setdefault(id(row), tag)
+            stack.append((iter(tag.contents), opened))
+
+    def find(self, element_id, name=None):
+        """Same as soup.find(name, id=element_id)"""
+        if name is None:
+            return self.ids.get(element_id)
+        return self._named_ids.get((name, element_id))
+
+    def next_table(self, element_id, class_name=None):
+        """Same as find(id=element_id).find_next("table", {"class": class_name})"""
+        position = self._positions.get(element_id)
+        if position is None:
+            return None
+        for i in range(bisect.bisect_right(self._table_positions, position), len(self._tables)):
+            if class_name is None or has_class(self._tables[i], class_name):
+                return self._tables[i]
+        return None
+
+    def rows(self, table):
+        return self._rows[id(table)]
+
+    def header(self, row):
+        """First th of a table row"""
+        return self._headers.get(id(row))
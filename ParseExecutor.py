@@ -0,0 +1,67 @@
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import os
+
+_worker_parser = None
+
+
+def _init_worker(parser):
+    global _worker_parser
+    _worker_parser = parser
+
+
+def _parse_in_worker(content, url, encoding, teams):
+    _worker_parser.teams = set(teams)
+    result, urls = _worker_parser.parse(content, url, encoding)
+    return result, urls, _worker_parser.teams - teams
+
+
+class InlineParseExecutor:
+    """Parse pages right on the event loop"""
+
+    def __init__(self, parser):
+        self._parser = parser
+
+    async def parse(self, content, url, encoding=None):
+        return self._parser.parse(content, url, encoding)
+
+    def shutdown(self):
+        pass
+
+
+class ProcessParseExecutor:
+    """Parse pages in a pool of worker processes.
+
+    Every worker gets its own copy of the parser. The parser state (known
+    national teams) is sent along with each page and whatever the worker
+    discovered is merged back into the local parser. At most max_pending
+    pages are queued to the pool, further parse calls wait for a free slot.
+    """
+
+    def __init__(self, parser, workers=None, max_pending=None):
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if max_pending is None:
+            max_pending = 2 * workers
+
+        self._parser = parser
+        self._pool = ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(parser,)
+        )
+        self._pending = asyncio.Semaphore(max_pending)
+
+    async def parse(self, content, url, encoding=None):
+        async with self._pending:
+            result, urls, teams = await asyncio.get_running_loop().run_in_executor(
+                self._pool,
+                _parse_in_worker,
+                content,
+                url,
+                encoding,
+                frozenset(self._parser.teams),
+            )
+        self._parser.teams.update(teams)
+        return result, urls
+
+    def shutdown(self):
+        self._pool.shutdown()
@@ -0,0 +1,124 @@
+import hashlib
+import inspect
+import json
+import sqlite3
+import time
+
+import ExtractionRules
+import PageIndex
+
+#   Modules the parsers extract through besides their own
+_EXTRACTION_MODULES = (PageIndex, ExtractionRules)
+
+
+def parser_version(parser):
+    """Fingerprint of the parser code and rules, changes whenever either is edited"""
+    digest = hashlib.sha256()
+    digest.update(type(parser).__qualname__.encode())
+    digest.update(str(getattr(parser, "_builder", "")).encode())
+    rules = getattr(parser, "rules", None)
+    if rules is not None:
+        digest.update(rules.fingerprint().encode())
+    sources = [cls for cls in type(parser).__mro__ if cls is not object]
+    sources.extend(_EXTRACTION_MODULES)
+    for source in sources:
+        with open(inspect.getsourcefile(source), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+class ParseMemo:
+    """SQLite store of parse results keyed by page content.
+
+    The key covers the page bytes, its url and the parser state the page
+    was parsed with, so a hit returns exactly what parse would. Entries of
+    other parser versions are dropped on open. When more than max_entries
+    are stored the least recently used ones are removed.
+    """
+
+    def __init__(self, path, version, max_entries=100000, commit_every=100):
+        self._db = sqlite3.connect(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS memo (key TEXT PRIMARY KEY, version TEXT NOT NULL, "
+            "result TEXT NOT NULL, urls TEXT NOT NULL, teams TEXT NOT NULL, used_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS memo_used_at ON memo (used_at)")
+        self._db.execute("DELETE FROM memo WHERE version != ?", (version,))
+        self._db.commit()
+
+        self._version = version
+        self._max_entries = max_entries
+        self._commit_every = commit_every
+        self._uncommitted = 0
+        self._count = self._db.execute("SELECT COUNT(*) FROM memo").fetchone()[0]
+
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, content, url, teams, encoding=None):
+        digest = hashlib.sha256(self._version.encode())
+        digest.update(url.encode())
+        digest.update(b"\0")
+        digest.update((encoding or "").lower().encode())
+        digest.update(b"\0")
+        digest.update("\0".join(sorted(teams)).encode())
+        digest.update(b"\0")
+        digest.update(content)
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Return (result, urls, teams) stored for key or None"""
+        row = self._db.execute(
+            "SELECT result, urls, teams FROM memo WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._db.execute("UPDATE memo SET used_at = ? WHERE key = ?", (time.time(), key))
+        self._maybe_commit()
+        return tuple(json.loads(value) for value in row)
+
+    def put(self, key, result, urls, teams):
+        exists = self._db.execute("SELECT 1 FROM memo WHERE key = ?", (key,)).fetchone()
+        self._db.execute(
+            "INSERT OR REPLACE INTO memo (key, version, result, urls, teams, used_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                key,
+                self._version,
+                json.dumps(result, ensure_ascii=False),
+                json.dumps(urls, ensure_ascii=False),
+                json.dumps(sorted(teams), ensure_ascii=False),
+                time.time(),
+            ),
+        )
+        if exists is None:
+            self._count += 1
+        if self._count > self._max_entries:
+            self._evict()
+        self._maybe_commit()
+
+    def _evict(self):
+        #   Free a tenth of the store at once, not a row per insert
+        to_remove = self._count - self._max_entries + self._max_entries // 10
+        self._db.execute(
+            "DELETE FROM memo WHERE key IN (SELECT key FROM memo ORDER BY used_at LIMIT ?)",
+            (to_remove,),
+        )
+        self._count = self._db.execute("SELECT COUNT(*) FROM memo").fetchone()[0]
+
+    def invalidate(self):
+        self._db.execute("DELETE FROM memo")
+        self._db.commit()
+        self._count = 0
+
+    def _maybe_commit(self):
+        self._uncommitted += 1
+        if self._uncommitted >= self._commit_every:
+            self._db.commit()
+            self._uncommitted = 0
+
+    def close(self):
+        self._db.commit()
+        self._db.close()
@@ -0,0 +1,139 @@
+import calendar
+import datetime as DT
+import operator
+import os
+import re
+
+import numpy as np
+
+from ColumnarSink import ColumnarReader, ColumnarSink
+from ExtractionRules import ExtractionRules
+from FileSink import FileSink
+
+#   Players born after this date are younger than 25 at the tournament
+YOUNG_BIRTH_TS = calendar.timegm(DT.datetime(1999, 1, 1, 0, 0, 0).utctimetuple())
+
+_OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">=": operator.ge,
+    "<=": operator.le,
+    ">": operator.gt,
+    "<": operator.lt,
+}
+_CONDITION = re.compile(r"^\s*(\w+)\s*(==|!=|>=|<=|>|<)\s*(.*?)\s*$")
+
+
+class PlayerAnalytics:
+    """Player records as NumPy columns.
+
+    Numeric fields are int32 arrays (int64 for the birth timestamp) with a
+    validity mask, as ColumnarSink lays them out. Text fields are
+    dictionary encoded (codes array + array of distinct values), so every
+    query is a handful of vectorized operations over the columns.
+    """
+
+    def __init__(self, numbers, valid, codes, values):
+        self._numbers = numbers
+        self._valid = valid
+        self._codes = codes
+        self._values = values
+        self.rows = len(next(iter(numbers.values())))
+
+    @classmethod
+    def from_jsonl(cls, path):
+        #   Same encoding as the columns a crawl writes with ColumnarSink, just kept in memory
+        sink = ColumnarSink(None)
+        for record in FileSink.read(path):
+            sink.write(record)
+        return cls(*sink.columns())
+
+    @classmethod
+    def from_columnar(cls, path):
+        reader = ColumnarReader(path)
+        return cls(
+            {field: reader.column(field) for field in reader.numeric_fields},
+            {field: reader.valid(field) for field in reader.numeric_fields},
+            {field: reader.column(field) for field in reader.dictionary_fields},
+            {field: reader.values(field) for field in reader.dictionary_fields},
+        )
+
+    @classmethod
+    def load(cls, path):
+        if os.path.isdir(path):
+            return cls.from_columnar(path)
+        return cls.from_jsonl(path)
+
+    def column(self, field):
+        return self._numbers[field]
+
+    def has(self, field):
+        return self._valid[field]
+
+    def equals(self, field, value):
+        """Mask of rows where a text field equals value"""
+        matches = np.flatnonzero(self._values[field] == value)
+        if len(matches) == 0:
+            return np.zeros(self.rows, dtype=bool)
+        return self._codes[field] == matches[0]
+
+    def where(self, condition):
+        """Mask for a condition like "height>180" or "position==вратарь" """
+        match = _CONDITION.match(condition)
+        if match is None:
+            raise ValueError(f"Can't parse condition {condition!r}")
+        field, op, value = match.groups()
+
+        if field in self._numbers:
+            return self.has(field) & _OPERATORS[op](self.column(field), int(value))
+        if field in self._codes and op in ("==", "!="):
+            mask = self.equals(field, value)
+            return mask if op == "==" else ~mask
+        raise ValueError(f"Unsupported condition {condition!r}")
+
+    def decode(self, field, row):
+        if field in self._codes:
+            return self._values[field][self._codes[field][row]]
+        return int(self.column(field)[row])
+
+    def rank(self, values, mask=None, descending=True, limit=1):
+        """Rows with the largest (or smallest) values among the masked ones, ties in file order"""
+        rows = np.arange(self.rows) if mask is None else np.flatnonzero(mask)
+        order = np.argsort(-values[rows] if descending else values[rows], kind="stable")
+        return rows[order[:limit]]
+
+    def best(self, values, mask, lowest=False):
+        """Masked arg-max (arg-min) with the same ties as a first-wins scan, None if nothing qualifies"""
+        if self.rows == 0:
+            return None
+        if lowest:
+            candidates = np.where(mask, values, np.iinfo(np.int64).max)
+            row = int(np.argmin(candidates))
+        else:
+            candidates = np.where(mask & (values > 0), values, np.iinfo(np.int64).min)
+            row = int(np.argmax(candidates))
+        if not (mask[row] and (lowest or values[row] > 0)):
+            return None
+        return row
+
+    def report(self, rules=None):
+        """Rows answering the homework questions, None where no player fits"""
+        if rules is None:
+            rules = ExtractionRules()
+        birth = self.column("birth")
+        young = self.has("birth") & (birth > YOUNG_BIRTH_TS)
+        everyone = np.ones(self.rows, dtype=bool)
+
+        return {
+            "young_most_club_caps": self.best(self.column("club_caps"), young),
+            "young_most_club_scored": self.best(self.column("club_scored"), young),
+            "tallest_scored_over_10": self.best(
+                self.column("height"),
+                self.column("club_scored") + self.column("national_scored") > 10,
+            ),
+            "oldest_goalkeeper": self.best(
+                birth, self.has("birth") & self.equals("position", rules.goalkeeper), lowest=True
+            ),
+            "most_national_caps": self.best(self.column("national_caps"), everyone),
+            "most_national_scored": self.best(self.column("national_scored"), everyone),
+        }
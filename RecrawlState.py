@@ -0,0 +1,132 @@
+import hashlib
+import json
+import re
+import sqlite3
+import time
+
+#   MediaWiki puts the revision of the rendered page into its config script
+_REVISION = re.compile(rb'"wgRevisionId":\s*(\d+)')
+
+
+def page_revision(content):
+    """Revision id of a Wikipedia page or None if the html does not have it"""
+    match = _REVISION.search(content)
+    return int(match.group(1)) if match else None
+
+
+class RecrawlState:
+    """What the previous runs learned about every page, in an SQLite file.
+
+    For each url it keeps the validators (ETag / Last-Modified), the
+    revision id and content hash of the page and the record, links and
+    teams parsing it produced. A page answering 304, or coming back with
+    the same revision or the same bytes, is not parsed again: its previous
+    record is emitted as is. Rows of another parser version are ignored,
+    those pages are fetched and parsed in full.
+    """
+
+    def __init__(self, path, version, batch_size=200):
+        self._db = sqlite3.connect(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, version TEXT NOT NULL, "
+            "etag TEXT, last_modified TEXT, revision INTEGER, content_hash TEXT NOT NULL, "
+            "record TEXT NOT NULL, urls TEXT NOT NULL, teams TEXT NOT NULL, checked_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+        self._version = version
+        self._batch_size = batch_size
+        self._pending = {}
+
+    def lookup(self, url):
+        """Return what is known about url from this parser version or None"""
+        if url in self._pending:
+            row = self._pending[url]
+        else:
+            row = self._db.execute(
+                "SELECT version, etag, last_modified, revision, content_hash, record, urls, teams, checked_at "
+                "FROM pages WHERE url = ?",
+                (url,),
+            ).fetchone()
+        if row is None or row[0] != self._version:
+            return None
+        return {
+            "etag": row[1],
+            "last_modified": row[2],
+            "revision": row[3],
+            "content_hash": row[4],
+            "record": json.loads(row[5]),
+            "urls": json.loads(row[6]),
+            "teams": json.loads(row[7]),
+        }
+
+    def conditional_headers(self, page):
+        headers = {}
+        if page["etag"]:
+            headers["If-None-Match"] = page["etag"]
+        if page["last_modified"]:
+            headers["If-Modified-Since"] = page["last_modified"]
+        return headers
+
+    def unchanged(self, page, content):
+        """True if content is the page seen last time"""
+        revision = page_revision(content)
+        if revision is not None and page["revision"] is not None:
+            return revision == page["revision"]
+        return hashlib.sha256(content).hexdigest() == page["content_hash"]
+
+    def update(self, url, headers, content, record, urls, teams):
+        """Remember a freshly parsed page"""
+        self._put(
+            url,
+            headers.get("ETag"),
+            headers.get("Last-Modified"),
+            page_revision(content),
+            hashlib.sha256(content).hexdigest(),
+            record,
+            urls,
+            teams,
+        )
+
+    def carried_over(self, url, page, headers):
+        """Page did not change, keep its record and take the new validators"""
+        self._put(
+            url,
+            headers.get("ETag", page["etag"]),
+            headers.get("Last-Modified", page["last_modified"]),
+            page["revision"],
+            page["content_hash"],
+            page["record"],
+            page["urls"],
+            page["teams"],
+        )
+
+    def _put(self, url, etag, last_modified, revision, content_hash, record, urls, teams):
+        self._pending[url] = (
+            self._version,
+            etag,
+            last_modified,
+            revision,
+            content_hash,
+            json.dumps(record, ensure_ascii=False),
+            json.dumps(urls, ensure_ascii=False),
+            json.dumps(sorted(teams), ensure_ascii=False),
+            time.time(),
+        )
+        if len(self._pending) >= self._batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO pages (url, version, etag, last_modified, revision, content_hash, "
+                "record, urls, teams, checked_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(url,) + row for url, row in self._pending.items()],
+            )
+        self._pending = {}
+
+    def close(self):
+        self.flush()
+        self._db.close()
@@ -0,0 +1,97 @@
+from collections import Counter
+from email.utils import parsedate_to_datetime
+import asyncio
+import heapq
+import itertools
+import random
+import time
+
+import aiohttp
+
+NETWORK = "network"
+HTTP_RETRYABLE = "http_retryable"
+PERMANENT = "permanent"
+
+RETRYABLE_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+
+def classify(error):
+    """Tell whether a failed download is worth another try"""
+    if isinstance(error, aiohttp.ClientResponseError):
+        if error.status in RETRYABLE_STATUSES:
+            return HTTP_RETRYABLE
+        return PERMANENT
+    if isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError, OSError)):
+        return NETWORK
+    #   Parse errors (missing infobox, unexpected page layout, etc.) repeat on every try
+    return PERMANENT
+
+
+def parse_retry_after(value):
+    """Seconds to wait for a Retry-After header (seconds or an HTTP date), None if unusable"""
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_after(error):
+    headers = getattr(error, "headers", None)
+    if not headers:
+        return None
+    return parse_retry_after(headers.get("Retry-After"))
+
+
+class RetryScheduler:
+    """Delay queue of items to try again.
+
+    Items wait in a heap ordered by the time of their next attempt. The
+    delay grows as base_delay * 2 ** (tries - 1) up to max_delay, with up
+    to jitter of it added at random so failed requests do not come back
+    all at once.
+    """
+
+    def __init__(self, base_delay=1.0, max_delay=60.0, jitter=0.5):
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._jitter = jitter
+        self._heap = []
+        self._order = itertools.count()
+        self.counters = Counter()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def backoff(self, tries, min_delay=None):
+        delay = min(self._max_delay, self._base_delay * 2 ** max(tries - 1, 0))
+        delay += delay * self._jitter * random.random()
+        if min_delay is not None:
+            delay = max(delay, min_delay)
+        return delay
+
+    def schedule(self, item, delay, now=None):
+        if now is None:
+            now = time.monotonic()
+        heapq.heappush(self._heap, (now + delay, next(self._order), item))
+
+    def pop_ready(self, now=None):
+        if now is None:
+            now = time.monotonic()
+        ready = []
+        while self._heap and self._heap[0][0] <= now:
+            ready.append(heapq.heappop(self._heap)[2])
+        return ready
+
+    def next_delay(self, now=None):
+        """Seconds until the next item is due or None if there is nothing to retry"""
+        if not self._heap:
+            return None
+        if now is None:
+            now = time.monotonic()
+        return max(self._heap[0][0] - now, 0)
@@ -1,8 +1,16 @@
-from collections import deque
-import time
+import itertools
 
-from SimpleRateLimiter import SimpleRateLimiter
+from TokenBucketRateLimiter import TokenBucketRateLimiter
+from ParseExecutor import InlineParseExecutor
+from CrawlFrontier import CrawlFrontier
+from HttpCache import CacheMiss
+from RetryScheduler import RetryScheduler, PERMANENT, classify, retry_after
+from StreamingExtractor import StreamingExtractor, section_anchors
 from Item import Item
+from ConcurrencyController import ConcurrencyController
+from Metrics import Metrics
+from UrlSet import UrlSet
+from canonical_url import canonicalize
 
 import aiohttp
 import asyncio
@@ -11,74 +19,460 @@ import time
 
 class AsyncRunner:
     def __init__(
-        self, parser, sink, logger, seed_urls, rate=100, max_parallel=5, max_tries=5
+        self,
+        parser,
+        sink,
+        logger,
+        seed_urls,
+        rate=100,
+        burst=1,
+        max_parallel=5,
+        min_parallel=None,
+        max_tries=5,
+        pool_limit=100,
+        pool_limit_per_host=10,
+        keepalive_timeout=30,
+        dns_cache_ttl=300,
+        timeout=60,
+        parse_executor=None,
+        streaming=False,
+        chunk_size=64 * 1024,
+        frontier=None,
+        skip_urls=(),
+        cache=None,
+        memo=None,
+        retry_base_delay=1.0,
+        retry_max_delay=60.0,
+        workers=None,
+        trace_configs=None,
+        metrics=None,
+        seen=None,
+        recrawl=None,
     ):
         self._logger = logger.getChild("AsyncRunner")
         self._parser = parser
         self._sink = sink
 
-        self._semaphore = asyncio.Semaphore(max_parallel)
-        self._in_air = set()
-        self._rate_limiter = SimpleRateLimiter(rate)
-        self._seen = set()
+        if parse_executor is None:
+            parse_executor = InlineParseExecutor(parser)
+        self._parse_executor = parse_executor
+
+        #   Fixed number of parallel downloads unless min_parallel is given
+        self._concurrency = ConcurrencyController(
+            min_parallel if min_parallel is not None else max_parallel,
+            max_parallel,
+            logger=self._logger,
+        )
+        if workers is None:
+            workers = 2 * max_parallel
+        self._workers = workers
+        #   (priority, order, item): deeper pages first, FIFO among equals. Depth
+        #   stands for the page kind: links of the tournament page (depth 0) are
+        #   team pages, links of team pages are player pages, so deeper first is
+        #   player links before team links. parse() does not return the kind.
+        self._queue = asyncio.PriorityQueue()
+        self._order = itertools.count()
+        self._unfinished = 0
+        self._finished = asyncio.Event()
+        self._retry_added = asyncio.Event()
+        self._rate_limiter = TokenBucketRateLimiter(
+            rate, burst=burst, logger=self._logger
+        )
+        #   Urls ever submitted, a UrlSet or BloomFilter instead of a set of strings
+        self._seen = seen if seen is not None else UrlSet()
         self._seed_urls = seed_urls
         self._max_tries = max_tries
-        self._future_to_item = {}
+        self._retries = RetryScheduler(retry_base_delay, retry_max_delay)
+
+        self._pool_limit = pool_limit
+        self._pool_limit_per_host = pool_limit_per_host
+        self._keepalive_timeout = keepalive_timeout
+        self._dns_cache_ttl = dns_cache_ttl
+        self._timeout = timeout
+        self._trace_configs = trace_configs
+        self._session = None
+
+        self._streaming = streaming
+        self._anchors = section_anchors(parser.rules) if streaming else None
+        self._chunk_size = chunk_size
+
+        self._frontier = frontier
+        self._frontier_task = None
+        self._skip_urls = set(skip_urls)
+
+        self._cache = cache
+        self._memo = memo
+        self._recrawl = recrawl
+
+        if metrics is None:
+            metrics = Metrics()
+        self._metrics = metrics
+        self._in_flight = 0
+        metrics.gauge("in_flight", lambda: self._in_flight)
+        metrics.gauge("parallel_limit", lambda: self._concurrency.limit)
+        metrics.gauge("frontier", lambda: self._queue.qsize() + len(self._retries))
+        metrics.gauge("seen", lambda: len(self._seen))
+
+    def _make_session(self):
+        connector = aiohttp.TCPConnector(
+            limit=self._pool_limit,
+            limit_per_host=self._pool_limit_per_host,
+            keepalive_timeout=self._keepalive_timeout,
+            ttl_dns_cache=self._dns_cache_ttl,
+        )
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self._timeout),
+            trace_configs=[self._metrics.trace_config()] + list(self._trace_configs or ()),
+        )
 
     def _submit(self, item):
-        item.start = time.time()
-        future = asyncio.ensure_future(self._download(item))
-        self._in_air.add(future)
-        self._future_to_item[future] = item
-        self._logger.info(f"Start: {item.url}")
         self._seen.add(item.url)
+        self._unfinished += 1
+        self._checkpoint(item, CrawlFrontier.DISCOVERED)
+        self._enqueue(item)
+
+    def _enqueue(self, item):
+        item.queued_ts = time.monotonic()
+        self._queue.put_nowait((-item.depth, next(self._order), item))
+
+    def _finish(self, item):
+        self._unfinished -= 1
+        if self._unfinished == 0:
+            self._finished.set()
+
+    def _checkpoint(self, item, state):
+        if self._frontier is None:
+            return
+        self._frontier.record(item.url, state, item.tries)
+
+        task = self._frontier_task
+        if task is not None:
+            if not task.done():
+                #   Updates keep piling up until the running save is over
+                return
+            self._frontier_task = None
+            task.result()
+        if self._frontier.should_flush():
+            self._frontier_task = asyncio.ensure_future(self._save_frontier())
+
+    def _observe(self, item, stage, start_ts):
+        self._metrics.observe(stage, time.monotonic() - start_ts, item.timings)
+
+    async def _save_frontier(self):
+        """Checkpoint in executor threads, the fsync and commit would stall every download"""
+        #   Pages already done are not parsed again after resume, so keep what the parser learned from them
+        self._frontier.record_state("teams", sorted(self._parser.teams))
+        batch = self._frontier.take()
+        loop = asyncio.get_running_loop()
+        #   Records have to reach the file before the frontier marks them done.
+        #   Every page in the batch was written before it was marked, so this flush covers them.
+        await loop.run_in_executor(None, self._sink.flush)
+        await loop.run_in_executor(None, self._frontier.write, batch)
+
+    def _flush_frontier(self):
+        #   Records have to reach the file before the frontier marks them done
+        self._sink.flush()
+        self._frontier.record_state("teams", sorted(self._parser.teams))
+        self._frontier.flush()
 
     async def _download(self, item):
-        async with self._semaphore:
-            await asyncio.sleep(self._rate_limiter.get_delay())
-            async with aiohttp.ClientSession(
-                timeout=aiohttp.ClientTimeout(total=60)
-            ) as session:
-                async with session.get(item.url) as resp:
+        cached = None
+        if self._cache is not None:
+            cached = self._cache.lookup(item.url)
+            if cached is not None and (
+                self._cache.offline or self._cache.is_fresh(cached)
+            ):
+                self._metrics.inc("cache_hits")
+                return await self._parse(
+                    item, self._cache.body(cached), cached["final_url"], cached["charset"]
+                )
+            if self._cache.offline:
+                raise CacheMiss(f"{item.url} is not cached")
+
+        headers = None
+        if cached is not None:
+            headers = self._cache.conditional_headers(cached)
+
+        previous = None
+        if self._recrawl is not None:
+            previous = self._recrawl.lookup(item.url)
+            if previous is not None and headers is None:
+                headers = self._recrawl.conditional_headers(previous)
+
+        start_ts = time.monotonic()
+        await self._rate_limiter.acquire(item.url)
+        self._observe(item, "rate_limit", start_ts)
+        async with self._concurrency.slot():
+            async with self._session.get(
+                item.url, headers=headers, trace_request_ctx=item.timings
+            ) as resp:
+                self._rate_limiter.on_response(
+                    item.url, resp.status, resp.headers.get("Retry-After")
+                )
+                if resp.status == 304 and cached is not None:
+                    self._metrics.inc("not_modified")
+                    self._cache.revalidated(cached, resp.headers)
+                    content = self._cache.body(cached)
+                    url = cached["final_url"]
+                    encoding = cached["charset"]
+                elif resp.status == 304 and previous is not None:
+                    self._metrics.inc("not_modified")
+                    return self._carry_over(item, previous, resp.headers)
+                else:
                     resp.raise_for_status()
-                    content = await resp.text()
-                    return self._parser.parse(content.encode(), str(resp.url))
+                    url = canonicalize(str(resp.url))
+                    if url != item.url and url != item.redirect_url:
+                        if url in self._seen:
+                            #   Redirected to a page crawled under its own name
+                            self._metrics.inc("duplicates_prevented")
+                            return None, []
+                        #   A retry of this item follows the same redirect, it must not count as a duplicate
+                        self._seen.add(url)
+                        item.redirect_url = url
+                    start_ts = time.monotonic()
+                    content, encoding = await self._read(resp, item, url)
+                    self._observe(item, "body", start_ts)
+                response_headers = resp.headers
+
+        if self._recrawl is None:
+            return await self._parse(item, content, url, encoding)
+        if previous is not None and self._recrawl.unchanged(previous, content):
+            return self._carry_over(item, previous, response_headers)
+
+        teams = frozenset(self._parser.teams)
+        result, urls = await self._parse(item, content, url, encoding)
+        self._recrawl.update(
+            item.url, response_headers, content, result, urls, self._parser.teams - teams
+        )
+        return result, urls
+
+    def _carry_over(self, item, previous, headers):
+        """Emit the record of a page that did not change since the last run"""
+        self._metrics.inc("carried_over")
+        self._recrawl.carried_over(item.url, previous, headers)
+        #   Player pages parsed later are checked against the teams this page gave
+        self._parser.teams.update(previous["teams"])
+        return previous["record"], previous["urls"]
+
+    async def _parse(self, item, content, url, encoding):
+        start_ts = time.monotonic()
+        try:
+            return await self._parse_content(content, url, encoding)
+        finally:
+            self._observe(item, "parse", start_ts)
+
+    async def _parse_content(self, content, url, encoding):
+        if self._memo is None:
+            return await self._parse_executor.parse(content, url, encoding)
+
+        teams = frozenset(self._parser.teams)
+        key = self._memo.key(content, url, teams, encoding)
+        memoized = self._memo.get(key)
+        if memoized is not None:
+            result, urls, new_teams = memoized
+            self._parser.teams.update(new_teams)
+            return result, urls
+
+        result, urls = await self._parse_executor.parse(content, url, encoding)
+        self._memo.put(key, result, urls, self._parser.teams - teams)
+        return result, urls
+
+    async def _read(self, resp, item, url):
+        """Return the page bytes to parse and their encoding"""
+        charset = resp.charset or "utf-8"
+        if self._streaming:
+            content, body = await self._extract(resp, keep_body=self._cache is not None)
+            encoding = "utf-8"
+        else:
+            #   The raw body goes to the parser as is, decoding it here and
+            #   encoding it back would copy a large page twice more
+            content = body = await resp.read()
+            encoding = charset
+
+        if self._cache is not None:
+            self._cache.store(item.url, body, url, charset, resp.headers)
+        return content, encoding
+
+    async def _extract(self, resp, keep_body=False):
+        extractor = StreamingExtractor(resp.charset or "utf-8", self._anchors)
+        chunks = []
+        async for chunk in resp.content.iter_chunked(self._chunk_size):
+            extractor.feed(chunk)
+            if keep_body:
+                chunks.append(chunk)
+        return extractor.close(), b"".join(chunks)
 
     async def run(self):
+        async with self._make_session() as session:
+            self._session = session
+            try:
+                await self._metrics.start()
+                await self._crawl()
+            finally:
+                self._session = None
+                if self._frontier is not None:
+                    if self._frontier_task is not None:
+                        await asyncio.gather(self._frontier_task, return_exceptions=True)
+                    self._flush_frontier()
+                if self._recrawl is not None:
+                    self._recrawl.flush()
+                await self._sink.close()
+                await self._metrics.stop()
+
+    def _resume(self):
+        self._seen.update(self._skip_urls)
+        if self._frontier is None:
+            return
+
+        self._parser.teams.update(self._frontier.load_state("teams", []))
+        resumed = 0
+        for url, (state, tries) in self._frontier.load().items():
+            if url in self._seen:
+                continue
+            self._seen.add(url)
+            if state in (CrawlFrontier.DISCOVERED, CrawlFrontier.IN_FLIGHT):
+                self._submit(Item(url, tries))
+                resumed += 1
+        self._logger.info(
+            f"Resume: {resumed} urls to fetch, {len(self._seen) - resumed} already handled"
+        )
+
+    async def _crawl(self):
+        self._resume()
         for elem in self._seed_urls:
+            elem = canonicalize(elem)
+            if elem in self._seen:
+                continue
             self._submit(Item(elem))
-        while len(self._in_air) > 0:
-            done, in_air = await asyncio.wait(
-                self._in_air, return_when=asyncio.FIRST_COMPLETED
+        if self._unfinished == 0:
+            return
+
+        await self._run_workers()
+        self._logger.info(f"Failures by kind: {dict(self._retries.counters)}")
+        self._logger.info(
+            f"Duplicate fetches prevented by canonical urls: {self._metrics.counters['duplicates_prevented']}"
+        )
+        if self._recrawl is not None:
+            self._logger.info(
+                f"Pages carried over from the previous run: {self._metrics.counters['carried_over']}"
             )
-            self._in_air = in_air
-            for future in done:
-                item = self._future_to_item.pop(future)
-                try:
-                    result, next = future.result()
-                except Exception as e:
-                    duration = time.time() - item.start
-                    item.tries += 1
-                    if item.tries > self._max_tries:
-                        self._write(item, error=str(e))
-                        self._logger.exception(
-                            f"Fail: {item.url} {e}. Tries = {item.tries}. Duration: {duration}s"
-                        )
-                        continue
-                    self._submit(item)
-                    self._logger.warning(
-                        f"Postpone: {item.url} {e}. Tries = {item.tries}. Duration: {duration}s"
-                    )
-                    continue
-                if result is not None:
-                    self._write(item, result=result)
-                for elem in next:
-                    if elem in self._seen:
-                        continue
-                    self._submit(Item(elem))
-                self._logger.info(
-                    f"Success: {item.url}. Tries = {item.tries}. Duration: {time.time() - item.start}s"
+
+    async def _run_workers(self):
+        """Process the queue until the crawl is finished"""
+        tasks = [asyncio.ensure_future(self._worker()) for _ in range(self._workers)]
+        tasks.append(asyncio.ensure_future(self._retry_pump()))
+        finished = asyncio.ensure_future(self._finished.wait())
+        try:
+            await asyncio.wait(tasks + [finished], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks + [finished]:
+                task.cancel()
+            results = await asyncio.gather(*tasks, finished, return_exceptions=True)
+
+        #   Workers never return on their own, so anything else is a crash
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+
+    async def _worker(self):
+        while True:
+            _, _, item = await self._queue.get()
+            await self._process(item)
+
+    async def _retry_pump(self):
+        while True:
+            self._retry_added.clear()
+            try:
+                await asyncio.wait_for(
+                    self._retry_added.wait(), self._retries.next_delay()
                 )
+            except asyncio.TimeoutError:
+                pass
+            for item in self._retries.pop_ready():
+                self._enqueue(item)
+
+    async def _process(self, item):
+        item.timings = {}
+        self._observe(item, "queue_wait", item.queued_ts)
+        item.start = time.monotonic()
+        self._logger.info(f"Start: {item.url}")
+        self._checkpoint(item, CrawlFrontier.IN_FLIGHT)
+        self._in_flight += 1
+        try:
+            result, next = await self._download(item)
+        except Exception as e:
+            self._on_failure(item, e)
+            return
+        finally:
+            self._in_flight -= 1
+
+        if result is not None:
+            self._write(item, result=result)
+        self._follow(item, self._canonical_links(next))
+        self._checkpoint(item, CrawlFrontier.DONE)
+        self._finish(item)
+        self._metrics.inc("pages")
+        self._trace(item, "done")
+        self._logger.info(
+            f"Success: {item.url}. Tries = {item.tries}. Duration: {time.monotonic() - item.start}s"
+        )
+
+    def _canonical_links(self, urls):
+        links = []
+        for url in urls:
+            link = canonicalize(url)
+            if link != url and link in self._seen:
+                #   The raw spelling would have passed the _seen check
+                self._metrics.inc("duplicates_prevented")
+            links.append(link)
+        return links
+
+    def _follow(self, item, urls):
+        for elem in urls:
+            if elem in self._seen:
+                continue
+            self._submit(Item(elem, depth=item.depth + 1))
+
+    def _trace(self, item, outcome, error=None):
+        record = {
+            "url": item.url,
+            "depth": item.depth,
+            "tries": item.tries,
+            "outcome": outcome,
+            "duration": time.monotonic() - item.start,
+            "timings": item.timings,
+        }
+        if error is not None:
+            record["error"] = error
+        self._metrics.trace(record)
+
+    def _on_failure(self, item, e):
+        duration = time.monotonic() - item.start
+        kind = classify(e)
+        self._retries.counters[kind] += 1
+        item.tries += 1
+
+        if kind == PERMANENT or item.tries > self._max_tries:
+            self._write(item, error=str(e))
+            self._checkpoint(item, CrawlFrontier.FAILED)
+            self._finish(item)
+            self._metrics.inc("failures")
+            self._trace(item, "failed", f"{kind}: {e}")
+            self._logger.exception(
+                f"Fail: {item.url} {e} ({kind}). Tries = {item.tries}. Duration: {duration}s"
+            )
+            return
+
+        delay = self._retries.backoff(item.tries, min_delay=retry_after(e))
+        self._retries.schedule(item, delay)
+        self._retry_added.set()
+        self._metrics.inc("retries")
+        self._trace(item, "retry", f"{kind}: {e}")
+        self._checkpoint(item, CrawlFrontier.IN_FLIGHT)
+        self._logger.warning(
+            f"Postpone: {item.url} {e} ({kind}). Tries = {item.tries}. Duration: {duration}s. Retry in {delay:.1f}s"
+        )
 
     def _write(self, item, result=None, error=None):
         if result is None and error is None:
@@ -92,4 +486,6 @@ class AsyncRunner:
         else:
             to_write = {"error": error, "url": item.url, "tries": item.tries}
 
+        start_ts = time.monotonic()
         self._sink.write(to_write)
+        self._observe(item, "sink_write", start_ts)
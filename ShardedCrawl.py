@@ -0,0 +1,255 @@
+from collections import Counter, defaultdict
+from multiprocessing.connection import Listener
+import asyncio
+import os
+import queue
+import threading
+
+from FileSink import FileSink
+from HashRing import HashRing
+from Item import Item
+from Runner import AsyncRunner
+from UrlSet import UrlSet
+
+#   Messages, all tuples sent with multiprocessing.connection:
+#   shard -> coordinator
+HELLO = "hello"  # (HELLO, shard_id, output_path)
+TEAMS = "teams"  # (TEAMS, [team, ...]) national teams found by the shard's parser
+PROGRESS = "progress"  # (PROGRESS, [(url, depth), ...] for other shards, urls queued locally, urls finished)
+BYE = "bye"  # (BYE, {counter: value})
+#   coordinator -> shard
+URLS = "urls"  # (URLS, [(url, depth), ...]) urls owned by the shard
+STOP = "stop"  # (STOP,) nothing is left to crawl anywhere
+
+
+class ShardRunner(AsyncRunner):
+    """AsyncRunner crawling the urls one shard of a HashRing owns.
+
+    Links owned by other shards go to the coordinator, which forwards them
+    to their owner, so the owner's _seen set alone deduplicates every url.
+    Parser teams are shared the same way. The runner stops when the
+    coordinator says so: it counts every url sent to or queued by a shard
+    until the shard reports it finished, and urls found on a page are
+    reported before the page itself, so zero means the crawl is over.
+    """
+
+    def __init__(self, *args, shard_id, shards, connection, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._shard_id = shard_id
+        self._ring = HashRing(shards)
+        self._connection = connection
+        self._forwarded = UrlSet()
+        self._outbox = []
+        self._queued = 0
+        self._shared_teams = set()
+
+    async def _crawl(self):
+        loop = asyncio.get_running_loop()
+        threading.Thread(
+            target=self._receive, args=(loop,), name="ShardReceiver", daemon=True
+        ).start()
+        await self._run_workers()
+        self._logger.info(f"Failures by kind: {dict(self._retries.counters)}")
+
+    def _receive(self, loop):
+        while True:
+            try:
+                message = self._connection.recv()
+            except (EOFError, OSError):
+                loop.call_soon_threadsafe(self._finished.set)
+                return
+            loop.call_soon_threadsafe(self._on_message, message)
+            if message[0] == STOP:
+                return
+
+    def _on_message(self, message):
+        kind = message[0]
+        if kind == URLS:
+            duplicates = 0
+            for url, depth in message[1]:
+                if url in self._seen:
+                    duplicates += 1
+                    continue
+                self._submit(Item(url, depth=depth))
+            if duplicates:
+                self._connection.send((PROGRESS, [], 0, duplicates))
+        elif kind == TEAMS:
+            self._shared_teams.update(message[1])
+            self._parser.teams.update(message[1])
+        elif kind == STOP:
+            self._finished.set()
+
+    def _follow(self, item, urls):
+        for url in urls:
+            if self._ring.owner(url) != self._shard_id:
+                if url not in self._forwarded:
+                    self._forwarded.add(url)
+                    self._outbox.append((url, item.depth + 1))
+            elif url not in self._seen:
+                self._submit(Item(url, depth=item.depth + 1))
+                self._queued += 1
+
+    def _finish(self, item):
+        self._unfinished -= 1
+        new_teams = self._parser.teams - self._shared_teams
+        if new_teams:
+            #   Before the links, so the pages they lead to are parsed knowing the teams
+            self._shared_teams.update(new_teams)
+            self._connection.send((TEAMS, sorted(new_teams)))
+        self._connection.send((PROGRESS, self._outbox, self._queued, 1))
+        self._outbox = []
+        self._queued = 0
+
+
+class ShardCoordinator:
+    """Routes urls between shard runners and detects the end of the crawl.
+
+    Listens on address (host, port) for shards connecting with
+    multiprocessing.connection.Client, on this machine or others. serve()
+    returns the output paths the shards reported once all of them stopped.
+    It fails if one of the local shard processes it is given exits before
+    joining.
+    """
+
+    def __init__(self, shards, address=("127.0.0.1", 0), authkey=None, logger=None):
+        self._shards = shards
+        self._ring = HashRing(shards)
+        self._listener = Listener(address, authkey=authkey)
+        self._logger = logger.getChild("ShardCoordinator") if logger else None
+        self._connections = {}
+        self._inbox = queue.Queue()
+        self._greetings = queue.Queue()
+        self._pending = 0
+        self._stopped = set()
+
+    @property
+    def address(self):
+        return self._listener.address
+
+    def _log(self, message):
+        if self._logger is not None:
+            self._logger.info(message)
+
+    def _read(self, shard_id, connection):
+        while True:
+            try:
+                message = connection.recv()
+            except (EOFError, OSError):
+                self._inbox.put((shard_id, None))
+                return
+            self._inbox.put((shard_id, message))
+            if message[0] == BYE:
+                return
+
+    def _route(self, urls):
+        by_owner = defaultdict(list)
+        for url, depth in urls:
+            by_owner[self._ring.owner(url)].append((url, depth))
+        for owner, owned in by_owner.items():
+            self._pending += len(owned)
+            self._connections[owner].send((URLS, owned))
+
+    def _accept(self):
+        #   accept() can't time out, so it blocks here and serve() keeps an eye on the processes
+        for _ in range(self._shards):
+            try:
+                connection = self._listener.accept()
+                greeting = connection.recv()
+            except (EOFError, OSError) as e:
+                self._greetings.put(e)
+                return
+            self._greetings.put((connection, greeting))
+
+    def _join(self, processes):
+        outputs = {}
+        self._log(f"Waiting for {self._shards} shards on {self.address}")
+        threading.Thread(target=self._accept, daemon=True).start()
+        try:
+            while len(self._connections) < self._shards:
+                try:
+                    joined = self._greetings.get(timeout=1)
+                except queue.Empty:
+                    for process in processes:
+                        if not process.is_alive():
+                            raise RuntimeError(
+                                f"Shard process {process.name} exited with code "
+                                f"{process.exitcode} before joining"
+                            )
+                    continue
+                if isinstance(joined, Exception):
+                    raise RuntimeError(f"Shard failed to join: {joined}")
+
+                connection, (kind, shard_id, output) = joined
+                if kind != HELLO or not 0 <= shard_id < self._shards or shard_id in outputs:
+                    connection.close()
+                    raise RuntimeError(f"Unexpected shard greeting {kind} {shard_id}")
+                self._connections[shard_id] = connection
+                outputs[shard_id] = output
+                threading.Thread(
+                    target=self._read, args=(shard_id, connection), daemon=True
+                ).start()
+                self._log(f"Shard {shard_id} joined, output {output}")
+        finally:
+            self._listener.close()
+        return outputs
+
+    def serve(self, seed_urls, processes=()):
+        """Crawl from seed_urls, processes are the shards started on this machine"""
+        outputs = self._join(processes)
+
+        self._route([(url, 0) for url in seed_urls])
+        try:
+            while self._pending > 0:
+                shard_id, message = self._inbox.get()
+                if message is None or message[0] == BYE:
+                    self._stopped.add(shard_id)
+                    raise RuntimeError(f"Shard {shard_id} stopped before the crawl was over")
+                if message[0] == PROGRESS:
+                    _, forwarded, queued, finished = message
+                    self._pending += queued - finished
+                    self._route(forwarded)
+                elif message[0] == TEAMS:
+                    for other_id, connection in self._connections.items():
+                        if other_id != shard_id:
+                            connection.send(message)
+        finally:
+            self._stop()
+
+        counters = Counter()
+        remaining = set(self._connections) - self._stopped
+        while remaining:
+            shard_id, message = self._inbox.get()
+            if message is None or message[0] == BYE:
+                remaining.discard(shard_id)
+                if message is not None:
+                    counters.update(message[1])
+        self._log(f"All shards stopped: {dict(counters)}")
+        return [outputs[shard_id] for shard_id in sorted(outputs)]
+
+    def _stop(self):
+        for connection in self._connections.values():
+            try:
+                connection.send((STOP,))
+            except OSError:
+                pass
+
+
+async def merge_outputs(paths, sink, compression=None):
+    """Write the records of the shard outputs to sink and remove them.
+
+    Returns the paths that do not exist here, e.g. outputs of shards that
+    ran on other machines without a shared file system.
+    """
+    merged = []
+    missing = []
+    for path in paths:
+        if not os.path.exists(path):
+            missing.append(path)
+            continue
+        for record in FileSink.read(path, compression):
+            sink.write(record)
+        merged.append(path)
+    await sink.close()
+    for path in merged:
+        FileSink.remove(path)
+    return missing
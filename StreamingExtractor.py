@@ -0,0 +1,122 @@
+from lxml import etree
+
+from ExtractionRules import ExtractionRules
+
+#   Section anchors the parser looks up by id and the table it reads after
+#   each of them: any table, the first "wikitable" or the teams table.
+ANY_TABLE = "any"
+WIKITABLE = "wikitable"
+TEAMS_TABLE = "standard sortable"
+
+#   Tables after the section anchors of every kind the parser reads
+SECTION_TABLES = {
+    "qualified_teams": TEAMS_TABLE,
+    "squad": WIKITABLE,
+    "club_stats": ANY_TABLE,
+    "national_stats": ANY_TABLE,
+}
+
+
+def section_anchors(rules):
+    return {
+        anchor: SECTION_TABLES[section]
+        for section, anchors in rules.sections.items()
+        for anchor in anchors
+    }
+
+
+SECTION_ANCHORS = section_anchors(ExtractionRules())
+
+
+def _table_matches(kind, class_attr):
+    if kind == ANY_TABLE:
+        return True
+    if kind == TEAMS_TABLE:
+        return " ".join(class_attr.split()) == TEAMS_TABLE
+    return kind in class_attr.split()
+
+
+class _Collector:
+    """lxml parser target that keeps only the infobox and the section tables"""
+
+    def __init__(self, anchors):
+        self._anchors = anchors
+        self._builder = etree.TreeBuilder()
+        self._builder.start("html", {})
+        self._builder.start("head", {})
+        self._builder.start("meta", {"charset": "utf-8"})
+        self._builder.end("meta")
+        self._builder.end("head")
+        self._builder.start("body", {})
+
+        self._has_infobox = False
+        self._pending = []
+        self._open = []
+
+    def start(self, tag, attrib):
+        is_wanted = False
+
+        if tag == "table":
+            class_attr = attrib.get("class", "")
+
+            if not self._has_infobox and "infobox" in class_attr.split():
+                self._has_infobox = True
+                is_wanted = True
+
+            pending = []
+            for kind in self._pending:
+                if _table_matches(kind, class_attr):
+                    is_wanted = True
+                else:
+                    pending.append(kind)
+            self._pending = pending
+
+        kind = self._anchors.get(attrib.get("id"))
+        if kind is not None:
+            self._pending.append(kind)
+
+        if self._open or is_wanted:
+            self._builder.start(tag, dict(attrib))
+            self._open.append(tag)
+        elif kind is not None:
+            self._builder.start(tag, {"id": attrib["id"]})
+            self._builder.end(tag)
+
+    def end(self, tag):
+        if self._open:
+            self._builder.end(self._open.pop())
+
+    def data(self, data):
+        if self._open:
+            self._builder.data(data)
+
+    def close(self):
+        while self._open:
+            self._builder.end(self._open.pop())
+        self._builder.end("body")
+        self._builder.end("html")
+        return self._builder.close()
+
+
+class StreamingExtractor:
+    """Incrementally parse an HTML page fed in chunks.
+
+    Only the first infobox and the tables following known section anchors
+    are built into a tree, the rest of the page is dropped while parsing.
+    close() returns a small UTF-8 document with these parts in the original
+    order, which any parse engine handles like the full page.
+    """
+
+    def __init__(self, encoding=None, anchors=None):
+        if anchors is None:
+            anchors = SECTION_ANCHORS
+        self._parser = etree.HTMLParser(
+            target=_Collector(anchors), encoding=encoding
+        )
+
+    def feed(self, chunk):
+        self._parser.feed(chunk)
+
+    def close(self):
+        root = self._parser.close()
+        return etree.tostring(root, encoding="utf-8", method="html")
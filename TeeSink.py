@@ -0,0 +1,17 @@
+class TeeSink:
+    """Send every record to several sinks"""
+
+    def __init__(self, sinks):
+        self._sinks = sinks
+
+    def write(self, item):
+        for sink in self._sinks:
+            sink.write(item)
+
+    def flush(self):
+        for sink in self._sinks:
+            sink.flush()
+
+    async def close(self):
+        for sink in self._sinks:
+            await sink.close()
@@ -0,0 +1,79 @@
+from urllib.parse import urlparse
+import asyncio
+import time
+
+from RetryScheduler import parse_retry_after
+
+
+class _Bucket:
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.tokens = burst
+        self.updated_ts = now
+        self.blocked_until_ts = 0
+
+
+class TokenBucketRateLimiter:
+    """Token bucket per host.
+
+    Every host gets rate requests per second with bursts of up to burst
+    requests. acquire() reserves a token and sleeps until it is due, so
+    callers are served in arrival order without holding anything else
+    while they wait. A 429/503 answer halves the host rate (down to
+    min_rate) and honours Retry-After; every successful answer gives back
+    a twentieth of the configured rate until it is reached again.
+    """
+
+    THROTTLE_STATUSES = (429, 503)
+
+    def __init__(self, rate, burst=1, min_rate=None, logger=None):
+        self._rate = rate
+        self._burst = burst
+        self._min_rate = min_rate if min_rate is not None else rate / 16
+        self._logger = logger
+        self._buckets = {}
+
+    def _bucket(self, url, now):
+        host = urlparse(url).netloc
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            bucket = self._buckets[host] = _Bucket(self._rate, self._burst, now)
+        return bucket
+
+    def get_delay(self, url, now=None):
+        """Take a token for url and return how long to wait before using it"""
+        if now is None:
+            now = time.monotonic()
+        bucket = self._bucket(url, now)
+
+        bucket.tokens = min(
+            self._burst, bucket.tokens + (now - bucket.updated_ts) * bucket.rate
+        )
+        bucket.updated_ts = now
+        bucket.tokens -= 1
+
+        delay = -bucket.tokens / bucket.rate if bucket.tokens < 0 else 0
+        return max(delay, bucket.blocked_until_ts - now)
+
+    async def acquire(self, url):
+        delay = self.get_delay(url)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def on_response(self, url, status, retry_after=None):
+        now = time.monotonic()
+        bucket = self._bucket(url, now)
+
+        if status in self.THROTTLE_STATUSES:
+            bucket.rate = max(self._min_rate, bucket.rate / 2)
+            pause = parse_retry_after(retry_after)
+            if pause is not None:
+                bucket.blocked_until_ts = max(
+                    bucket.blocked_until_ts, now + pause
+                )
+            if self._logger is not None:
+                self._logger.warning(
+                    f"Throttled by {urlparse(url).netloc} ({status}): rate {bucket.rate:.2f}/s, pause {pause}s"
+                )
+        elif status < 400 and bucket.rate < self._rate:
+            bucket.rate = min(self._rate, bucket.rate + self._rate / 20)
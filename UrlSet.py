@@ -0,0 +1,106 @@
+from array import array
+import hashlib
+import math
+
+
+def fingerprint(url):
+    """64 bit id of a url, 0 is kept for empty slots"""
+    value = int.from_bytes(hashlib.blake2b(url.encode(), digest_size=8).digest(), "big")
+    return value or 1
+
+
+class UrlSet:
+    """Set of urls stored as 64 bit fingerprints.
+
+    An open addressing table in an array of unsigned 64 bit ints kept at
+    most half full, so a url costs 16-32 bytes instead of a str object and
+    a set slot. Two urls are confused only if their fingerprints collide,
+    about one chance in 10^8 for a billion urls.
+    """
+
+    def __init__(self, urls=()):
+        self._table = array("Q", bytes(8 * 1024))
+        self._mask = len(self._table) - 1
+        self._size = 0
+        self.update(urls)
+
+    def __len__(self):
+        return self._size
+
+    def _slot(self, value):
+        i = value & self._mask
+        table = self._table
+        while table[i] != 0 and table[i] != value:
+            i = (i + 1) & self._mask
+        return i
+
+    def __contains__(self, url):
+        value = fingerprint(url)
+        return self._table[self._slot(value)] == value
+
+    def add(self, url):
+        value = fingerprint(url)
+        i = self._slot(value)
+        if self._table[i] == value:
+            return
+        self._table[i] = value
+        self._size += 1
+        if 2 * self._size > len(self._table):
+            self._grow()
+
+    def update(self, urls):
+        for url in urls:
+            self.add(url)
+
+    def _grow(self):
+        old = self._table
+        self._table = array("Q", bytes(16 * len(old)))
+        self._mask = len(self._table) - 1
+        for value in old:
+            if value != 0:
+                self._table[self._slot(value)] = value
+
+
+class BloomFilter:
+    """Set of urls that may wrongly claim to contain a url.
+
+    Sized for capacity urls with the given false positive rate, e.g. about
+    1.8 bytes per url at 0.1%. A false positive makes the crawler skip a
+    page it has not seen, so keep the rate low and the capacity above the
+    expected number of urls; past capacity the rate goes up.
+    """
+
+    def __init__(self, capacity, error_rate=0.001, urls=()):
+        self._bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self._hashes = max(1, round(self._bits / capacity * math.log(2)))
+        self._array = bytearray((self._bits + 7) // 8)
+        self._size = 0
+        self.update(urls)
+
+    def __len__(self):
+        """Number of urls added (not counting ones it took for seen)"""
+        return self._size
+
+    def _positions(self, url):
+        digest = hashlib.blake2b(url.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        return [(h1 + i * h2) % self._bits for i in range(self._hashes)]
+
+    def __contains__(self, url):
+        return all(
+            self._array[bit >> 3] & (1 << (bit & 7)) for bit in self._positions(url)
+        )
+
+    def add(self, url):
+        added = False
+        for bit in self._positions(url):
+            if not self._array[bit >> 3] & (1 << (bit & 7)):
+                self._array[bit >> 3] |= 1 << (bit & 7)
+                added = True
+        if added:
+            self._size += 1
+
+    def update(self, urls):
+        for url in urls:
+            self.add(url)
@@ -0,0 +1,34 @@
+from urllib.parse import parse_qsl, quote, unquote, urlsplit, urlunsplit
+
+#   Characters MediaWiki leaves unescaped in article paths (wfUrlencode)
+_PATH_SAFE = "/;@$!*(),~:"
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def canonicalize(url):
+    """One spelling for every address of a page.
+
+    Lower-cases scheme and host, drops the default port and the fragment,
+    re-encodes the path the way MediaWiki does (so encoded and decoded
+    forms match) and turns index.php?title=X into /wiki/X.
+    """
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port is not None and parts.port != _DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+
+    path = parts.path or "/"
+    query = parts.query
+    if path.endswith("/index.php") and query:
+        params = parse_qsl(query, keep_blank_values=True)
+        if len(params) == 1 and params[0][0] == "title":
+            path = "/wiki/" + params[0][1]
+            query = ""
+
+    if path.startswith("/wiki/"):
+        path = path.replace(" ", "_")
+    path = quote(unquote(path), safe=_PATH_SAFE)
+
+    return urlunsplit((scheme, host, path, query, ""))
@@ -1,21 +1,31 @@
 from bs4 import BeautifulSoup
+from PageIndex import PageIndex, has_class
+from ExtractionRules import ExtractionRules
 import calendar
 import datetime as DT
-from urllib.parse import urljoin, urlparse
+from urllib.parse import urljoin
 import re
 import time
 
-teams = set()
+NUMBER = re.compile(r"\b\d+\b")
 
-class CssSelectorParser:
-    def parse(self, content, current_url):
-        netloc = urlparse(current_url).netloc
-        scheme = urlparse(current_url).scheme
-        domain = scheme + "://" + netloc
-        self._domain = domain
 
-        soup = BeautifulSoup(content, "html.parser")
-        table = soup.select_one("table.infobox")
+class CssSelectorParser:
+    def __init__(self, teams=None, builder="html.parser", rules=None):
+        #   National teams found on the tournament page. Player pages are
+        #   checked against them, so this state has to follow the parser
+        #   into worker processes.
+        self.teams = set(teams or ())
+        self._builder = builder
+        #   Labels and section ids of the Wikipedia edition, see ExtractionRules
+        self.rules = rules if rules is not None else ExtractionRules()
+
+    def parse(self, content, current_url, encoding=None):
+        """Parse page bytes (or str); encoding is the charset the server declared"""
+        self._url = current_url
+
+        index = PageIndex(BeautifulSoup(content, self._builder, from_encoding=encoding))
+        table = index.infobox
 
         result = None
         urls = []
@@ -23,32 +33,32 @@ class CssSelectorParser:
         if table is None:
             raise Exception("404")
 
-        table = table.attrs.get("data-name")
+        kind = self.rules.page_kind(table.attrs.get("data-name"))
 
-        if "Соревнование футбольных сборных" in table:
-            result, urls = self._main_page_parse(soup)
-        elif "Сборная страны по футболу" in table:
-            result, urls = self._team_parse(soup)
-        elif "Футболист" in table:
-            result, urls = self._player_parse(soup, current_url)
+        if kind == "main_page":
+            result, urls = self._main_page_parse(index)
+        elif kind == "team":
+            result, urls = self._team_parse(index)
+        elif kind == "player":
+            result, urls = self._player_parse(index, current_url)
 
         return result, urls
 
     def _main_page_parse(self, data):
         """Find table with all teams that will participate, find all links in row and take the last that goes to country team page"""
 
-        team_table = data.find(id="Квалифицировались_в_финальный_турнир").find_next(
-            "table", {"class": "standard sortable"}
+        team_table = data.next_table(
+            self.rules.sections["qualified_teams"][0], "standard sortable"
         )
         all_web_links = []
 
-        for row in team_table.find_all("tr")[1:]:
+        for row in data.rows(team_table)[1:]:
             col = row.find("td")
             url = col.select("a")[-1]
 
             if url is not None:
-                teams.add(url.get('title').strip("\n\r"))
-                all_web_links.append(self._domain + url.get("href"))
+                self.teams.add(url.get('title').strip("\n\r"))
+                all_web_links.append(urljoin(self._url, url.get("href")))
 
         return None, all_web_links
 
@@ -56,9 +66,8 @@ class CssSelectorParser:
         tags = []
 
         for header in headers:
-            tag = data.find('span', {'id' : header})
-            if tag is not None:
-                tags.append(tag)
+            if data.find(header, "span") is not None:
+                tags.append(header)
 
         return tags
 
@@ -66,18 +75,10 @@ class CssSelectorParser:
         tables = []
         actual_web_links = []
 
-        headers = [
-            "Текущий_состав",
-            "Текущий_состав_сборной",
-            "Состав",
-            "Состав_сборной",
-            'Недавние_вызовы',
-        ]
-
-        relevant_tags = self._find_relevant_tags(data, headers)
+        relevant_tags = self._find_relevant_tags(data, self.rules.sections["squad"])
 
         for tag in relevant_tags:
-            table = tag.find_next("table", {"class": "wikitable"})
+            table = data.next_table(tag, "wikitable")
 
             if table is not None:
                 tables.append(table)
@@ -86,73 +87,58 @@ class CssSelectorParser:
             if table is None:
                 continue
 
-            for row in table.find_all("tr")[1:]:
+            for row in data.rows(table)[1:]:
                 cols = row.find_all("td")
 
                 if len(cols) < 2:
                     continue
 
-                url = self._domain + cols[2].find("a").get("href")
+                url = urljoin(self._url, cols[2].find("a").get("href"))
                 actual_web_links.append(url)
 
         return None, actual_web_links
 
     def _get_bday(self, day : str, month : str, year : str) -> list:
-        months = [
-            "января",
-            "февраля",
-            "марта",
-            "апреля",
-            "мая",
-            "июня",
-            "июля",
-            "августа",
-            "сентября",
-            "октября",
-            "ноября",
-            "декабря",
-        ]
-
-        month_num = months.index(month) + 1
+        month_num = self.rules.months[month]
         utc_timestamp = int(calendar.timegm(DT.datetime(int(year), month_num, int(day), 0, 0, 0).utctimetuple()))
 
         return utc_timestamp, f"{year}.{month_num}.{day}"
 
     def _calc_height(self, text_height : str) -> int:
-        return int(re.match(r"\b\d+\b", text_height).group(0))
+        return int(NUMBER.match(text_height).group(0))
 
     def _calc_club_goals(self, player_data, goals):
-        re_goals = re.search(r"\b\d+\b", goals)
+        re_goals = NUMBER.search(goals)
 
         if re_goals is not None:
             re_goals = int(re_goals.group(0))
         else:
             re_goals = 0
 
-        if player_data["position"] == "вратарь":
+        if player_data["position"] == self.rules.goalkeeper:
             player_data["club_conceded"] += int(re_goals)
         else:
             player_data["club_scored"] += int(re_goals)
 
     def _process_national_additional_table(self, data, player_data):
-        relevant_tag = [data.find(id=tag) for tag in ["Статистика_в_сборной", 'Матчи_за_сборную'] if data.find(id=tag) is not None]
+        relevant_tag = [tag for tag in self.rules.sections["national_stats"] if data.find(tag) is not None]
 
         if (not len(relevant_tag)):
             return
 
-        table = relevant_tag[0].find_next('table')
+        table = data.next_table(relevant_tag[0])
 
-        last_row = table.find_all("tr")[-1]
+        last_row = data.rows(table)[-1]
         cols = last_row.find_all("th")
 
-        if len(cols) != 0 and cols[0].text.strip() == "Итого":
-            goals = int(re.search(r"\b\d+\b", cols[2].text.strip()).group(0))
+        if len(cols) != 0 and cols[0].text.strip() in self.rules.national_totals:
+            goals = int(NUMBER.search(cols[2].text.strip()).group(0))
             matches = int(cols[1].text.strip())
 
             if player_data["national_caps"] < matches:
                 player_data["national_caps"] = matches
 
-            if player_data["position"] == "вратарь":
+            if player_data["position"] == self.rules.goalkeeper:
                 if player_data["national_conceded"] < goals:
                     player_data["national_conceded"] = goals
             else:
@@ -161,22 +147,17 @@ class CssSelectorParser:
 
     def _process_club_additional_table(self, data, player_data):
         relevant_tag = [
-            data.find(id=tag)
-            for tag in [
-                "Клубная_статистика",
-                "Статистика_выступлений",
-                "Клубная",
-                "Статистика",
-            ]
-            if data.find(id=tag) is not None
+            tag
+            for tag in self.rules.sections["club_stats"]
+            if data.find(tag) is not None
         ]
 
         if (not len(relevant_tag)):
             return
 
-        table = relevant_tag[0].find_next("table")
+        table = data.next_table(relevant_tag[0])
 
-        last_row = table.find_all("tr")[-1]
+        last_row = data.rows(table)[-1]
         cols_th = last_row.find_all("th")
         cols_td = last_row.find_all("td")
         cols = []
@@ -188,10 +169,10 @@ class CssSelectorParser:
 
         if (
             len(cols_th) != 0
-            and cols_th[0].text.strip() in ["Всего за карьеру", "Всего"]
+            and cols_th[0].text.strip() in self.rules.club_totals
         ) or (
             len(cols_td) != 0
-            and cols_td[0].text.strip() in ["Всего за карьеру", "Всего"]
+            and cols_td[0].text.strip() in self.rules.club_totals
         ):
             matches = cols[-2].text.strip()
             goals = 0
@@ -208,9 +189,9 @@ class CssSelectorParser:
             if player_data["club_caps"] < matches:
                 player_data["club_caps"] = matches
 
-            if player_data["position"] == "вратарь":
+            if player_data["position"] == self.rules.goalkeeper:
                 if not is_diff_location:
-                    goals = re.search(r'\b\d+\b', cols[-1].text.strip())
+                    goals = NUMBER.search(cols[-1].text.strip())
 
                     if goals is not None:
                         goals = int(goals.group(0))
@@ -225,17 +206,38 @@ class CssSelectorParser:
                 if player_data["club_scored"] < goals:
                     player_data["club_scored"] = goals
 
+    def _extract_birth(self, row, player_data):
+        bday = row.find("span", {"class": "nowrap"}).find_all("a")
+        bday[0] = bday[0].text
+        bday[1] = bday[1].text
+
+        day, month = bday[0].split()
+        year = bday[1]
+
+        utc_timestamp, birth_str = self._get_bday(day, month, year)
+
+        player_data["birth"] = utc_timestamp
+        player_data["birt_str"] = birth_str
+
+    def _extract_height(self, row, player_data):
+        player_data["height"] = self._calc_height(row.text.strip().split("\n")[2])
+
+    def _extract_position(self, row, player_data):
+        player_data["position"] = row.find("td").text.strip()
+
+    def _extract_current_club(self, row, player_data):
+        player_data["current_club"] = row.find("span", {"class": "no-wikidata"}).text.strip()
+
     def _find_player_info_main_table(self, data, player_data):
         national_team_career_ind = 0
         club_career_ind = 0
 
         has_name = False
 
-        infobox = data.find("table", {"class": "infobox"})
-        rows = infobox.find_all("tr")
+        rows = data.rows(data.infobox)
 
-        for row in rows:
-            line_type = row.find("th")
+        for i, row in enumerate(rows):
+            line_type = data.header(row)
 
             if line_type is None:
                 continue
@@ -243,7 +245,7 @@ class CssSelectorParser:
             line_type_text = line_type.text.strip()
 
             if not has_name:
-                name_line = row.find("div", {"class": "ts_Спортсмен_имя"})
+                name_line = row.find("div", {"class": self.rules.player_name_class})
 
                 if  name_line is not None:
                     name = name_line.text.strip().split()
@@ -254,31 +256,16 @@ class CssSelectorParser:
                     player_data["name"] = name[::-1]
                     has_name = True
 
-            elif re.search(r"\bРодился\b", line_type_text):
-                bday = row.find("span", {"class": "nowrap"}).find_all("a")
-                bday[0] = bday[0].text
-                bday[1] = bday[1].text
-
-                day, month = bday[0].split()
-                year = bday[1]
-
-                utc_timestamp, birth_str = self._get_bday(day, month, year)
-
-                player_data["birth"] = utc_timestamp
-                player_data["birt_str"] = birth_str
-            elif re.search(r"\bРост\b", line_type_text):
-                height = self._calc_height(row.text.strip().split("\n")[2])
-                player_data["height"] = height
-            elif re.search(r"\bПозиция\b", line_type_text):
-                pos = row.find("td").text.strip()
-                player_data["position"] = pos
-            elif re.search(r"\bКлуб\b", line_type_text):
-                club = row.find("span", {"class": "no-wikidata"}).text.strip()
-                player_data["current_club"] = club
-            elif re.search(r"\bКлубная карьера\b", line_type_text):
-                club_career_ind = rows.index(row)
-            elif re.search(r"\bНациональная сборная\b", line_type_text):
-                national_team_career_ind = rows.index(row)
+                continue
+
+            field = self.rules.infobox_field(line_type_text)
+
+            if field == "club_career":
+                club_career_ind = i
+            elif field == "national_career":
+                national_team_career_ind = i
+            elif field is not None:
+                getattr(self, f"_extract_{field}")(row, player_data)
 
         if national_team_career_ind == 0:
             national_team_career_ind = len(rows)
@@ -296,7 +283,7 @@ class CssSelectorParser:
             matches = matches.strip()
             goals = goals.strip()[:-1]
 
-            matches = re.search(r"\b\d+\b", matches)
+            matches = NUMBER.search(matches)
 
             if matches is not None:
                 player_data["club_caps"] += int(matches.group(0))
@@ -306,29 +293,29 @@ class CssSelectorParser:
         if national_team_career_ind != 0:
             has_national_team = False
 
-            trs = infobox.find_all('tr', {'class': "nowrap odd"})
+            trs = [tr for tr in rows if has_class(tr, "nowrap odd")]
             last_tr = trs[-1]
             tds = last_tr.find_all('td')
             right_td = tds[-1]
             text = right_td.text.strip()
             team_line = tds[1].find_all("a")[-1]["title"].strip()
 
-            if team_line in teams:
+            if team_line in self.teams:
                 has_national_team = True
             else:
-                trs = infobox.find_all("tr", {"class": "nowrap even"})
+                trs = [tr for tr in rows if has_class(tr, "nowrap even")]
                 last_tr = trs[-1]
                 tds = last_tr.find_all("td")
                 right_td = tds[-1]
                 text = right_td.text.strip()
                 team_line = tds[1].find_all("a")[-1]["title"].strip()
 
-                if team_line in teams:
+                if team_line in self.teams:
                     has_national_team = True
 
             if (has_national_team):
                 matches, goals = text.split("(")
-                matches = re.search(r"\b\d+\b", matches)
+                matches = NUMBER.search(matches)
                 goals = goals.strip()[:-1]
 
                 if matches is not None:
@@ -337,14 +324,14 @@ class CssSelectorParser:
                 player_data["national_caps"] = matches
                 player_data["national_team"] = team_line
 
-                goals = re.search(r"\b\d+\b", goals)
+                goals = NUMBER.search(goals)
 
                 if goals is not None:
                     goals = int(goals.group(0))
                 else:
                     goals = 0
 
-                if player_data["position"] == "вратарь":
+                if player_data["position"] == self.rules.goalkeeper:
                     player_data["national_conceded"] = goals
                 else:
                     player_data["national_scored"] = goals
@@ -0,0 +1,350 @@
+from lxml import etree
+import lxml.html
+from urllib.parse import urljoin
+
+from css_selector_parser import NUMBER, CssSelectorParser
+
+
+def _has_class(name):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+def _next(tag, condition=""):
+    """Same as bs4 find_next: first matching tag inside or after the element"""
+    return etree.XPath(
+        f"(descendant::{tag}{condition} | following::{tag}{condition})[1]"
+    )
+
+
+_HTML_PARSER = lxml.html.HTMLParser(encoding="utf-8")
+_HTML_PARSERS = {"utf-8": _HTML_PARSER}
+
+
+def _html_parser(encoding):
+    """Parser decoding page bytes from encoding, one kept per charset"""
+    encoding = (encoding or "utf-8").lower()
+    parser = _HTML_PARSERS.get(encoding)
+    if parser is None:
+        parser = _HTML_PARSERS[encoding] = lxml.html.HTMLParser(encoding=encoding)
+    return parser
+
+_INFOBOX = etree.XPath(f"(//table[{_has_class('infobox')}])[1]")
+_BY_ID = etree.XPath("(//*[@id = $id])[1]")
+_SPAN_BY_ID = etree.XPath("(//span[@id = $id])[1]")
+
+_NEXT_TABLE = _next("table")
+_NEXT_WIKITABLE = _next("table", f"[{_has_class('wikitable')}]")
+_NEXT_TEAMS_TABLE = _next("table", "[normalize-space(@class) = 'standard sortable']")
+
+_TR = etree.XPath(".//tr")
+_TD = etree.XPath(".//td")
+_TH = etree.XPath(".//th")
+_A = etree.XPath(".//a")
+_FIRST_TD = etree.XPath("(.//td)[1]")
+_FIRST_TH = etree.XPath("(.//th)[1]")
+_FIRST_A = etree.XPath("(.//a)[1]")
+_PLAYER_NAME = etree.XPath(
+    "(.//div[contains(concat(' ', normalize-space(@class), ' '), concat(' ', $name, ' '))])[1]"
+)
+_BIRTH_DATE = etree.XPath(f"(.//span[{_has_class('nowrap')}])[1]")
+_CURRENT_CLUB = etree.XPath(f"(.//span[{_has_class('no-wikidata')}])[1]")
+_NATIONAL_ROWS_ODD = etree.XPath(".//tr[normalize-space(@class) = 'nowrap odd']")
+_NATIONAL_ROWS_EVEN = etree.XPath(".//tr[normalize-space(@class) = 'nowrap even']")
+
+
+def _first(xpath, elem, **variables):
+    found = xpath(elem, **variables)
+    return found[0] if found else None
+
+
+def _text(elem):
+    return elem.text_content()
+
+
+class LxmlSelectorParser(CssSelectorParser):
+    """Same extraction rules as CssSelectorParser, evaluated with compiled XPath on an lxml tree"""
+
+    def parse(self, content, current_url, encoding=None):
+        self._url = current_url
+
+        root = lxml.html.document_fromstring(content, parser=_html_parser(encoding))
+        table = _first(_INFOBOX, root)
+
+        result = None
+        urls = []
+
+        if table is None:
+            raise Exception("404")
+
+        kind = self.rules.page_kind(table.get("data-name"))
+
+        if kind == "main_page":
+            result, urls = self._main_page_parse(root)
+        elif kind == "team":
+            result, urls = self._team_parse(root)
+        elif kind == "player":
+            result, urls = self._player_parse(root, current_url)
+
+        return result, urls
+
+    def _main_page_parse(self, data):
+        team_table = _first(
+            _NEXT_TEAMS_TABLE,
+            _first(_BY_ID, data, id=self.rules.sections["qualified_teams"][0]),
+        )
+        all_web_links = []
+
+        for row in _TR(team_table)[1:]:
+            col = _first(_FIRST_TD, row)
+            url = _A(col)[-1]
+
+            if url is not None:
+                self.teams.add(url.get("title").strip("\n\r"))
+                all_web_links.append(urljoin(self._url, url.get("href")))
+
+        return None, all_web_links
+
+    def _find_relevant_tags(self, data, headers):
+        tags = []
+
+        for header in headers:
+            tag = _first(_SPAN_BY_ID, data, id=header)
+            if tag is not None:
+                tags.append(tag)
+
+        return tags
+
+    def _team_parse(self, data):
+        actual_web_links = []
+
+        for tag in self._find_relevant_tags(data, self.rules.sections["squad"]):
+            table = _first(_NEXT_WIKITABLE, tag)
+
+            if table is None:
+                continue
+
+            for row in _TR(table)[1:]:
+                cols = _TD(row)
+
+                if len(cols) < 2:
+                    continue
+
+                url = urljoin(self._url, _first(_FIRST_A, cols[2]).get("href"))
+                actual_web_links.append(url)
+
+        return None, actual_web_links
+
+    def _process_national_additional_table(self, data, player_data):
+        relevant_tag = [
+            tag
+            for tag in (
+                _first(_BY_ID, data, id=tag_id)
+                for tag_id in self.rules.sections["national_stats"]
+            )
+            if tag is not None
+        ]
+
+        if not len(relevant_tag):
+            return
+
+        table = _first(_NEXT_TABLE, relevant_tag[0])
+
+        last_row = _TR(table)[-1]
+        cols = _TH(last_row)
+
+        if len(cols) != 0 and _text(cols[0]).strip() in self.rules.national_totals:
+            goals = int(NUMBER.search(_text(cols[2]).strip()).group(0))
+            matches = int(_text(cols[1]).strip())
+
+            if player_data["national_caps"] < matches:
+                player_data["national_caps"] = matches
+
+            if player_data["position"] == self.rules.goalkeeper:
+                if player_data["national_conceded"] < goals:
+                    player_data["national_conceded"] = goals
+            else:
+                if player_data["national_scored"] < goals:
+                    player_data["national_scored"] = goals
+
+    def _process_club_additional_table(self, data, player_data):
+        relevant_tag = [
+            tag
+            for tag in (
+                _first(_BY_ID, data, id=tag_id)
+                for tag_id in self.rules.sections["club_stats"]
+            )
+            if tag is not None
+        ]
+
+        if not len(relevant_tag):
+            return
+
+        table = _first(_NEXT_TABLE, relevant_tag[0])
+
+        last_row = _TR(table)[-1]
+        cols_th = _TH(last_row)
+        cols_td = _TD(last_row)
+        cols = []
+
+        if len(cols_td) > len(cols_th):
+            cols = cols_td
+        else:
+            cols = cols_th
+
+        if (
+            len(cols_th) != 0
+            and _text(cols_th[0]).strip() in self.rules.club_totals
+        ) or (
+            len(cols_td) != 0
+            and _text(cols_td[0]).strip() in self.rules.club_totals
+        ):
+            matches = _text(cols[-2]).strip()
+            goals = 0
+            is_diff_location = False
+
+            #   Matches may be swaped with goals on some pages
+            if not matches[0].isnumeric():
+                goals = int(matches[1:])
+                matches = int(_text(cols[-3]).strip())
+                is_diff_location = True
+            else:
+                matches = int(matches)
+
+            if player_data["club_caps"] < matches:
+                player_data["club_caps"] = matches
+
+            if player_data["position"] == self.rules.goalkeeper:
+                if not is_diff_location:
+                    goals = NUMBER.search(_text(cols[-1]).strip())
+
+                    if goals is not None:
+                        goals = int(goals.group(0))
+                    else:
+                        goals = 0
+
+                if player_data["club_conceded"] < goals:
+                    player_data["club_conceded"] = goals
+            else:
+                goals = int(_text(cols[-1]).strip())
+
+                if player_data["club_scored"] < goals:
+                    player_data["club_scored"] = goals
+
+    def _extract_birth(self, row, player_data):
+        bday = _A(_first(_BIRTH_DATE, row))
+
+        day, month = _text(bday[0]).split()
+        year = _text(bday[1])
+
+        utc_timestamp, birth_str = self._get_bday(day, month, year)
+
+        player_data["birth"] = utc_timestamp
+        player_data["birt_str"] = birth_str
+
+    def _extract_height(self, row, player_data):
+        player_data["height"] = self._calc_height(_text(row).strip().split("\n")[2])
+
+    def _extract_position(self, row, player_data):
+        player_data["position"] = _text(_first(_FIRST_TD, row)).strip()
+
+    def _extract_current_club(self, row, player_data):
+        player_data["current_club"] = _text(_first(_CURRENT_CLUB, row)).strip()
+
+    def _find_player_info_main_table(self, data, player_data):
+        national_team_career_ind = 0
+        club_career_ind = 0
+
+        has_name = False
+
+        infobox = _first(_INFOBOX, data)
+        rows = _TR(infobox)
+
+        for ind, row in enumerate(rows):
+            line_type = _first(_FIRST_TH, row)
+
+            if line_type is None:
+                continue
+
+            line_type_text = _text(line_type).strip()
+
+            if not has_name:
+                name_line = _first(_PLAYER_NAME, row, name=self.rules.player_name_class)
+
+                if name_line is not None:
+                    name = _text(name_line).strip().split()
+
+                    if len(name) > 2:
+                        name = [" ".join([name[0], name[1]]), name[2]]
+
+                    player_data["name"] = name[::-1]
+                    has_name = True
+
+                continue
+
+            field = self.rules.infobox_field(line_type_text)
+
+            if field == "club_career":
+                club_career_ind = ind
+            elif field == "national_career":
+                national_team_career_ind = ind
+            elif field is not None:
+                getattr(self, f"_extract_{field}")(row, player_data)
+
+        if national_team_career_ind == 0:
+            national_team_career_ind = len(rows)
+
+        for i in range(club_career_ind + 1, national_team_career_ind, 1):
+            td = _TD(rows[i])
+
+            if len(td) != 3:
+                break
+
+            text = _text(td[-1]).strip()
+
+            matches, goals = text.split("(")
+            matches = matches.strip()
+            goals = goals.strip()[:-1]
+
+            matches = NUMBER.search(matches)
+
+            if matches is not None:
+                player_data["club_caps"] += int(matches.group(0))
+
+            self._calc_club_goals(player_data, goals)
+
+        if national_team_career_ind != 0:
+            has_national_team = False
+
+            for national_rows in (_NATIONAL_ROWS_ODD, _NATIONAL_ROWS_EVEN):
+                tds = _TD(national_rows(infobox)[-1])
+                text = _text(tds[-1]).strip()
+                team_line = _A(tds[1])[-1].get("title").strip()
+
+                if team_line in self.teams:
+                    has_national_team = True
+                    break
+
+            if has_national_team:
+                matches, goals = text.split("(")
+                matches = NUMBER.search(matches)
+                goals = goals.strip()[:-1]
+
+                if matches is not None:
+                    matches = int(matches.group(0))
+
+                player_data["national_caps"] = matches
+                player_data["national_team"] = team_line
+
+                goals = NUMBER.search(goals)
+
+                if goals is not None:
+                    goals = int(goals.group(0))
+                else:
+                    goals = 0
+
+                if player_data["position"] == self.rules.goalkeeper:
+                    player_data["national_conceded"] = goals
+                else:
+                    player_data["national_scored"] = goals
+            else:
+                raise Exception("Player has not played for national team yet")
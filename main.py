@@ -1,12 +1,516 @@
 from Runner import AsyncRunner
 from css_selector_parser import CssSelectorParser
+from lxml_selector_parser import LxmlSelectorParser
 from FileSink import FileSink
+from ColumnarSink import ColumnarSink
+from TeeSink import TeeSink
+from Metrics import Metrics
+from UrlSet import BloomFilter, UrlSet
+from canonical_url import canonicalize
+from CrawlFrontier import CrawlFrontier
+from HttpCache import HttpCache
+from ParseMemo import ParseMemo, parser_version
+from RecrawlState import RecrawlState
+from LocalCorpus import CorpusPageParser, CorpusRunner, LocalCorpus
+from ExtractionRules import ExtractionRules
+from ParseExecutor import InlineParseExecutor, ProcessParseExecutor
+from ShardedCrawl import BYE, HELLO, ShardCoordinator, ShardRunner, merge_outputs
+from multiprocessing.connection import Client
+import argparse
 import logging
-import sys
+import multiprocessing
+import os
 import time
 import asyncio
 
 
+PARSE_ENGINES = {
+    "bs4": lambda rules: CssSelectorParser(builder="html.parser", rules=rules),
+    "bs4-lxml": lambda rules: CssSelectorParser(builder="lxml", rules=rules),
+    "lxml": lambda rules: LxmlSelectorParser(rules=rules),
+}
+
+
+def parse_args():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("start_url")
+    arg_parser.add_argument("output_file_name")
+    arg_parser.add_argument(
+        "--rate",
+        type=float,
+        default=10,
+        help="Requests per second to each host",
+    )
+    arg_parser.add_argument(
+        "--burst",
+        type=int,
+        default=1,
+        help="Requests a host may get at once before the rate applies",
+    )
+    arg_parser.add_argument(
+        "--max-parallel",
+        type=int,
+        default=10,
+        help="Max number of parallel downloads",
+    )
+    arg_parser.add_argument(
+        "--min-parallel",
+        type=int,
+        default=1,
+        help="Least number of parallel downloads --adaptive goes down to",
+    )
+    arg_parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="Adjust parallel downloads between --min-parallel and --max-parallel "
+        "to the server latency and errors",
+    )
+    arg_parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of crawl worker coroutines (default - twice the parallel downloads)",
+    )
+    arg_parser.add_argument(
+        "--max-tries",
+        type=int,
+        default=2,
+        help="Retries of a page after network errors and retryable HTTP statuses",
+    )
+    arg_parser.add_argument(
+        "--retry-delay",
+        type=float,
+        default=1.0,
+        help="Delay before the first retry, doubled on every next one",
+    )
+    arg_parser.add_argument(
+        "--pool-limit",
+        type=int,
+        default=100,
+        help="Total number of pooled connections (0 - unlimited)",
+    )
+    arg_parser.add_argument(
+        "--pool-limit-per-host",
+        type=int,
+        default=10,
+        help="Number of pooled connections per host (0 - unlimited)",
+    )
+    arg_parser.add_argument(
+        "--keepalive-timeout",
+        type=float,
+        default=30,
+        help="Seconds to keep an idle connection open",
+    )
+    arg_parser.add_argument(
+        "--dns-cache-ttl",
+        type=int,
+        default=300,
+        help="Seconds to cache resolved host names",
+    )
+    arg_parser.add_argument(
+        "--engine",
+        choices=sorted(PARSE_ENGINES),
+        default="bs4",
+        help="Parse engine: BeautifulSoup on html.parser or lxml builder, or plain lxml with XPath",
+    )
+    arg_parser.add_argument(
+        "--rules",
+        default=None,
+        help="JSON file with labels and section ids of another Wikipedia edition (see ExtractionRules.py)",
+    )
+    arg_parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="Parse pages while downloading and keep only the infobox and stats tables",
+    )
+    arg_parser.add_argument(
+        "--parse-workers",
+        type=int,
+        default=0,
+        help="Parse pages in that many worker processes (0 - parse on the event loop)",
+    )
+    arg_parser.add_argument(
+        "--parse-queue",
+        type=int,
+        default=None,
+        help="Max pages waiting for a parse worker (default - twice the workers)",
+    )
+    arg_parser.add_argument(
+        "--corpus",
+        default=None,
+        help="Parse saved pages from this directory, tar or zip file instead of crawling: "
+        "start at the page of start_url and follow links to pages in the corpus",
+    )
+    arg_parser.add_argument(
+        "--frontier",
+        default=None,
+        help="Checkpoint crawl state to this SQLite file",
+    )
+    arg_parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue the crawl saved in --frontier, appending to the output file",
+    )
+    arg_parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="Keep downloaded pages in this directory and revalidate them on re-runs",
+    )
+    arg_parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=24 * 3600,
+        help="Seconds a cached page is used without asking the server",
+    )
+    arg_parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=1024,
+        help="Max size of cached (compressed) pages in megabytes",
+    )
+    arg_parser.add_argument(
+        "--cache-only",
+        action="store_true",
+        help="Replay the crawl from --cache-dir without any network requests",
+    )
+    arg_parser.add_argument(
+        "--memo",
+        default=None,
+        help="Reuse parse results of unchanged pages stored in this SQLite file",
+    )
+    arg_parser.add_argument(
+        "--memo-size",
+        type=int,
+        default=100000,
+        help="Max number of memoized parse results",
+    )
+    arg_parser.add_argument(
+        "--memo-clear",
+        action="store_true",
+        help="Drop all memoized parse results before the crawl",
+    )
+    arg_parser.add_argument(
+        "--recrawl-state",
+        default=None,
+        help="Incremental mode: keep validators and records of every page in this SQLite file "
+        "and carry pages that did not change over from the previous run",
+    )
+    arg_parser.add_argument(
+        "--output-rotate-mb",
+        type=int,
+        default=None,
+        help="Start a new output part (output.1, output.2, ...) after that many megabytes",
+    )
+    arg_parser.add_argument(
+        "--output-compression",
+        choices=["gzip", "zstd"],
+        default=None,
+        help="Compress the output file",
+    )
+    arg_parser.add_argument(
+        "--columnar-output",
+        default=None,
+        help="Also write player records as typed columns (.npy) to this directory",
+    )
+    arg_parser.add_argument(
+        "--metrics-interval",
+        type=float,
+        default=10,
+        help="Seconds between logged metrics summaries (0 - only at the end)",
+    )
+    arg_parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=None,
+        help="Serve metrics in Prometheus format on 127.0.0.1:PORT/metrics",
+    )
+    arg_parser.add_argument(
+        "--trace-file",
+        default=None,
+        help="Append stage timings of every page attempt to this JSON lines file",
+    )
+    arg_parser.add_argument(
+        "--bloom-capacity",
+        type=int,
+        default=None,
+        help="Remember seen urls in a Bloom filter sized for that many urls instead of an exact set",
+    )
+    arg_parser.add_argument(
+        "--bloom-error-rate",
+        type=float,
+        default=0.001,
+        help="False positive rate of the Bloom filter (pages wrongly skipped as seen)",
+    )
+    arg_parser.add_argument(
+        "--shards",
+        type=int,
+        default=1,
+        help="Split the crawl between that many processes, each owning a part of the urls",
+    )
+    arg_parser.add_argument(
+        "--local-shards",
+        type=int,
+        default=None,
+        help="Shards started by this process, the rest join from other machines (default - all)",
+    )
+    arg_parser.add_argument(
+        "--shard-listen",
+        default="127.0.0.1:0",
+        help="HOST:PORT the shard coordinator listens on",
+    )
+    arg_parser.add_argument(
+        "--join",
+        default=None,
+        help="Run one shard for the coordinator at HOST:PORT, writing to output_file_name",
+    )
+    arg_parser.add_argument(
+        "--shard-id",
+        type=int,
+        default=None,
+        help="Shard number of a --join process",
+    )
+    arg_parser.add_argument(
+        "--shard-secret",
+        default=None,
+        help="Shared secret of the coordinator and remote shards",
+    )
+    args = arg_parser.parse_args()
+    if args.resume and args.frontier is None:
+        arg_parser.error("--resume requires --frontier")
+    if args.cache_only and args.cache_dir is None:
+        arg_parser.error("--cache-only requires --cache-dir")
+    if not 1 <= args.min_parallel <= args.max_parallel:
+        arg_parser.error("--min-parallel must be between 1 and --max-parallel")
+
+    if args.local_shards is None:
+        args.local_shards = args.shards
+    sharded = args.shards > 1 or args.join is not None
+    if sharded and (
+        args.frontier is not None or args.memo is not None or args.recrawl_state is not None
+    ):
+        arg_parser.error("--frontier, --memo and --recrawl-state can't be used with shards")
+    if args.corpus is not None and (
+        sharded
+        or args.frontier is not None
+        or args.resume
+        or args.memo is not None
+        or args.recrawl_state is not None
+        or args.cache_dir is not None
+        or args.streaming
+    ):
+        arg_parser.error(
+            "--corpus can't be used with shards, --frontier, --resume, --memo, "
+            "--recrawl-state, --cache-dir or --streaming"
+        )
+    if args.join is not None and args.shard_id is None:
+        arg_parser.error("--join requires --shard-id")
+    if args.shard_id is not None and not 0 <= args.shard_id < args.shards:
+        arg_parser.error("--shard-id must be below --shards")
+    if not 0 <= args.local_shards <= args.shards:
+        arg_parser.error("--local-shards must be between 0 and --shards")
+    remote = args.join is not None or args.local_shards < args.shards
+    if remote and args.shard_secret is None:
+        arg_parser.error("Shards on other machines require --shard-secret")
+    return args
+
+
+def parse_address(address):
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+
+def make_sink(args, output_file_name, resume=False, columnar=True):
+    sink = FileSink(
+        output_file_name,
+        append=resume,
+        max_bytes=args.output_rotate_mb and args.output_rotate_mb * 1024 * 1024,
+        compression=args.output_compression,
+    )
+    if columnar and args.columnar_output is not None:
+        columnar_sink = ColumnarSink(args.columnar_output)
+        if resume:
+            #   Columns are only written on close, rebuild them from what the crawl already produced
+            for record in FileSink.read(output_file_name, args.output_compression):
+                columnar_sink.write(record)
+        sink = TeeSink([sink, columnar_sink])
+    return sink
+
+
+def make_cache(args):
+    if args.cache_dir is None:
+        return None
+    return HttpCache(
+        args.cache_dir,
+        ttl=args.cache_ttl,
+        max_size=args.cache_size * 1024 * 1024,
+        offline=args.cache_only,
+    )
+
+
+def make_metrics(args, logger, shard_id=None):
+    prometheus_port = args.metrics_port
+    trace_path = args.trace_file
+    if shard_id is not None:
+        if prometheus_port is not None:
+            prometheus_port += shard_id
+        if trace_path is not None:
+            trace_path = f"{trace_path}.shard{shard_id}"
+    return Metrics(
+        logger,
+        summary_interval=args.metrics_interval,
+        prometheus_port=prometheus_port,
+        trace_path=trace_path,
+    )
+
+
+def make_seen(args):
+    if args.bloom_capacity is None:
+        return UrlSet()
+    return BloomFilter(args.bloom_capacity, args.bloom_error_rate)
+
+
+def runner_options(args):
+    return dict(
+        rate=args.rate,
+        burst=args.burst,
+        max_tries=args.max_tries,
+        max_parallel=args.max_parallel,
+        min_parallel=args.min_parallel if args.adaptive else None,
+        pool_limit=args.pool_limit,
+        pool_limit_per_host=args.pool_limit_per_host,
+        keepalive_timeout=args.keepalive_timeout,
+        dns_cache_ttl=args.dns_cache_ttl,
+        streaming=args.streaming,
+        retry_base_delay=args.retry_delay,
+        workers=args.workers,
+        seen=make_seen(args),
+    )
+
+
+async def crawl(args, logger, parser, make_runner, frontier=None, memo=None, recrawl=None):
+    if args.parse_workers > 0:
+        parse_executor = ProcessParseExecutor(
+            parser, workers=args.parse_workers, max_pending=args.parse_queue
+        )
+    else:
+        parse_executor = InlineParseExecutor(parser)
+
+    runner = make_runner(parse_executor)
+
+    start = time.time()
+    try:
+        await runner.run()
+    finally:
+        parse_executor.shutdown()
+        if frontier is not None:
+            frontier.close()
+        if memo is not None:
+            logger.info(f"Parse memo: {memo.hits} hits, {memo.misses} misses")
+            memo.close()
+        if recrawl is not None:
+            recrawl.close()
+    logger.info(f"Total duration is {time.time() - start}")
+
+
+def run_shard(args, shard_id, address, authkey, output_file_name):
+    logger = logging.getLogger("Runner").getChild(f"shard{shard_id}")
+    connection = Client(address, authkey=authkey)
+    connection.send((HELLO, shard_id, os.path.abspath(output_file_name)))
+
+    rules = ExtractionRules.load(args.rules) if args.rules is not None else None
+    parser = PARSE_ENGINES[args.engine](rules)
+    sink = make_sink(args, output_file_name, columnar=False)
+    cache = make_cache(args)
+    metrics = make_metrics(args, logger, shard_id)
+    options = runner_options(args)
+    #   Every shard downloads from the same hosts
+    options["rate"] = args.rate / args.shards
+
+    def make_runner(parse_executor):
+        return ShardRunner(
+            parser,
+            sink,
+            logger,
+            [],
+            parse_executor=parse_executor,
+            cache=cache,
+            metrics=metrics,
+            shard_id=shard_id,
+            shards=args.shards,
+            connection=connection,
+            **options,
+        )
+
+    try:
+        asyncio.run(crawl(args, logger, parser, make_runner))
+    finally:
+        connection.send((BYE, dict(metrics.counters)))
+        connection.close()
+
+
+def run_sharded(args, logger):
+    if args.shard_secret is not None:
+        authkey = args.shard_secret.encode()
+    else:
+        authkey = os.urandom(16)
+    coordinator = ShardCoordinator(
+        args.shards,
+        address=parse_address(args.shard_listen),
+        authkey=authkey,
+        logger=logger,
+    )
+
+    processes = [
+        multiprocessing.Process(
+            target=run_shard,
+            args=(
+                args,
+                shard_id,
+                coordinator.address,
+                authkey,
+                f"{args.output_file_name}.shard{shard_id}",
+            ),
+        )
+        for shard_id in range(args.local_shards)
+    ]
+    for process in processes:
+        process.start()
+
+    start = time.time()
+    try:
+        outputs = coordinator.serve([canonicalize(args.start_url)], processes)
+    except BaseException:
+        for process in processes:
+            process.terminate()
+        raise
+    finally:
+        for process in processes:
+            process.join()
+
+    sink = make_sink(args, args.output_file_name)
+    missing = asyncio.run(merge_outputs(outputs, sink, args.output_compression))
+    for path in missing:
+        logger.warning(f"Shard output {path} is not on this machine, merge it separately")
+    logger.info(f"Total duration is {time.time() - start}")
+
+
+def run_corpus(args, logger):
+    rules = ExtractionRules.load(args.rules) if args.rules is not None else None
+    corpus = LocalCorpus(args.corpus)
+    parser = CorpusPageParser(PARSE_ENGINES[args.engine](rules), args.corpus)
+    sink = make_sink(args, args.output_file_name)
+
+    def make_runner(parse_executor):
+        return CorpusRunner(
+            parser, sink, logger, corpus, args.start_url, parse_executor
+        )
+
+    try:
+        asyncio.run(crawl(args, logger, parser, make_runner))
+    finally:
+        corpus.close()
+
+
 def main():
     logging.basicConfig(
         format="[%(asctime)s %(name)s %(levelname)s: %(message)s]",
@@ -14,23 +518,72 @@ def main():
         level="INFO",
     )
 
+    args = parse_args()
     logger = logging.getLogger("Runner")
-    start_url = [sys.argv[1]]
-    output_file_name = sys.argv[2]
-
-    parser = CssSelectorParser()
-    sink = FileSink(output_file_name)
 
-    async def start_func():
-        runner = AsyncRunner(
-            parser, sink, logger, start_url, rate=10, max_tries=2, max_parallel=10
+    if args.join is not None:
+        run_shard(
+            args,
+            args.shard_id,
+            parse_address(args.join),
+            args.shard_secret.encode(),
+            args.output_file_name,
         )
+        return
+    if args.shards > 1:
+        run_sharded(args, logger)
+        return
+    if args.corpus is not None:
+        run_corpus(args, logger)
+        return
 
-        start = time.time()
-        await runner.run()
-        logger.info(f"Total duration is {time.time() - start}")
+    start_url = [args.start_url]
+    output_file_name = args.output_file_name
+
+    rules = ExtractionRules.load(args.rules) if args.rules is not None else None
+    parser = PARSE_ENGINES[args.engine](rules)
+    skip_urls = set()
+    if args.resume:
+        skip_urls = FileSink.recover(output_file_name, args.output_compression)
+    sink = make_sink(args, output_file_name, resume=args.resume)
+
+    frontier = None
+    if args.frontier is not None:
+        frontier = CrawlFrontier(args.frontier, reset=not args.resume)
+
+    cache = make_cache(args)
 
-    asyncio.run(start_func())
+    memo = None
+    if args.memo is not None:
+        memo = ParseMemo(args.memo, parser_version(parser), max_entries=args.memo_size)
+        if args.memo_clear:
+            memo.invalidate()
+
+    recrawl = None
+    if args.recrawl_state is not None:
+        recrawl = RecrawlState(args.recrawl_state, parser_version(parser))
+
+    metrics = make_metrics(args, logger)
+
+    def make_runner(parse_executor):
+        return AsyncRunner(
+            parser,
+            sink,
+            logger,
+            start_url,
+            parse_executor=parse_executor,
+            frontier=frontier,
+            skip_urls=skip_urls,
+            cache=cache,
+            memo=memo,
+            metrics=metrics,
+            recrawl=recrawl,
+            **runner_options(args),
+        )
+
+    asyncio.run(
+        crawl(args, logger, parser, make_runner, frontier=frontier, memo=memo, recrawl=recrawl)
+    )
 
 
 if __name__ == "__main__":
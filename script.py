@@ -1,94 +1,74 @@
-import json
-from dateutil import parser
-import sys
-import datetime as DT
-import calendar
+import argparse
+
+import numpy as np
+
+from ColumnarSink import NUMERIC_FIELDS
+from ExtractionRules import ExtractionRules
+from PlayerAnalytics import PlayerAnalytics
+
+
+def make_arg_parser():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument(
+        "path", help="Result in JSON lines or a directory written by ColumnarSink"
+    )
+    arg_parser.add_argument(
+        "--where",
+        action="append",
+        default=[],
+        help='Filter like "height>180" or "position==вратарь", may be repeated',
+    )
+    arg_parser.add_argument(
+        "--rank",
+        default=None,
+        choices=sorted(NUMERIC_FIELDS),
+        help="Print players with the largest values of this numeric field",
+    )
+    arg_parser.add_argument(
+        "--asc", action="store_true", help="Rank by the smallest values instead"
+    )
+    arg_parser.add_argument("--limit", type=int, default=10)
+    arg_parser.add_argument(
+        "--rules",
+        default=None,
+        help="JSON file with the labels of another Wikipedia edition, see ExtractionRules",
+    )
+    return arg_parser
 
 
 def main():
-    data = []
-
-    file = sys.argv[1]
-
-    with open(file, encoding="utf-8") as f:
-        data = [json.loads(line) for line in f]
-
-    start = DT.datetime(1999, 1, 1, 0, 0, 0)
-    utc_tuple = start.utctimetuple()
-    years_25 = calendar.timegm(utc_tuple)
-
-    matches = 0
-    goals = 0
-    height = 0
-    first_player = None
-    second_player = None
-    third_player = None
-    fourth_player = None
-    fifth_player = None
-    sixth_player = None
-    years = 10**11
-
-    for player in data:
-        if 'error' in player.keys():
-            continue
-
-        if player['birth'] > years_25 and matches < player['club_caps']:
-            matches = player["club_caps"]
-            first_player = player
-
-    for player in data:
-        if "error" in player.keys():
-            continue
-
-        if (
-            player["birth"] > years_25
-            and goals < player["club_scored"]
-        ):
-            goals = player["club_scored"]
-            second_player = player
-
-    for player in data:
-        if "error" in player.keys():
-            continue
-
-        if player['club_scored'] + player['national_scored'] > 10 and height < player['height']:
-            height = player["height"]
-            third_player = player
-
-    for player in data:
-        if "error" in player.keys():
-            continue
-
-        if player['position'] == 'вратарь' and years > player['birth']:
-            years = player["birth"]
-            fourth_player = player
-
-    matches = 0
-
-    for player in data:
-        if "error" in player.keys():
-            continue
-
-        if matches < player["national_caps"]:
-            matches = player["national_caps"]
-            fifth_player = player
-
-    goals = 0
-
-    for player in data:
-        if "error" in player.keys():
-            continue
-
-        if goals < player["national_scored"]:
-            goals = player["national_scored"]
-            sixth_player = player
-
-    print(first_player['name'])
-    print(second_player['name'])
-    print(third_player['name'])
-    print(fourth_player['name'])
-    print(fifth_player['name'])
-    print(sixth_player['name'])
+    arg_parser = make_arg_parser()
+    args = arg_parser.parse_args()
+    players = PlayerAnalytics.load(args.path)
+
+    if args.rank is None and not args.where:
+        rules = ExtractionRules.load(args.rules) if args.rules is not None else None
+        for row in players.report(rules).values():
+            print(None if row is None else players.decode("name", row))
+        return
+
+    mask = None
+    for condition in args.where:
+        try:
+            condition_mask = players.where(condition)
+        except (ValueError, KeyError) as e:
+            arg_parser.error(f"--where {condition!r}: {e}")
+        mask = condition_mask if mask is None else mask & condition_mask
+
+    if args.rank is None:
+        values = np.zeros(players.rows, dtype=np.int64)
+    else:
+        values = players.column(args.rank)
+        if mask is None:
+            mask = players.has(args.rank)
+        else:
+            mask = mask & players.has(args.rank)
+
+    for row in players.rank(values, mask, descending=not args.asc, limit=args.limit):
+        line = [players.decode("name", row)]
+        if args.rank is not None:
+            line.append(players.decode(args.rank, row))
+        print(*line)
 
 
 if __name__ == '__main__':
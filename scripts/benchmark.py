@@ -0,0 +1,442 @@
+"""Offline crawl and parse benchmark over test_data.
+
+Starts a replay server for test_data/*.html in a separate process, crawls
+it with AsyncRunner and times every parse kind on every fixture. Results
+are printed and saved to JSON so runs can be compared over time.
+
+Usage: python scripts/benchmark.py [--latency 0.05 --jitter 0.02 --error-rate 0.05]
+"""
+import argparse
+import asyncio
+import datetime as DT
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from urllib.parse import quote
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import aiohttp
+from aiohttp import web
+from bs4 import BeautifulSoup
+import lxml.html
+
+from FileSink import FileSink
+from Metrics import Metrics
+from PageIndex import PageIndex
+from ParseExecutor import InlineParseExecutor, ProcessParseExecutor
+from Runner import AsyncRunner
+from lxml_selector_parser import LxmlSelectorParser, _HTML_PARSER
+from main import PARSE_ENGINES
+
+TEST_DATA = os.path.join(ROOT, "test_data")
+SEED_PAGE = "Чемпионат_Европы_по_футболу_2024"
+
+
+def _percentiles(values):
+    if not values:
+        return {}
+    values = sorted(values)
+
+    def rank(p):
+        return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+    return {
+        "count": len(values),
+        "mean": statistics.mean(values),
+        "p50": rank(50),
+        "p95": rank(95),
+        "p99": rank(99),
+        "max": values[-1],
+    }
+
+
+def _load_pages():
+    pages = {}
+    for file_name in sorted(os.listdir(TEST_DATA)):
+        if file_name.endswith(".html"):
+            with open(os.path.join(TEST_DATA, file_name), "rb") as f:
+                pages[file_name[: -len(".html")]] = f.read()
+    return pages
+
+
+def _serve(conn, latency, jitter, error_rate, seed):
+    """Replay server process: sends its port back through conn and serves until killed"""
+    pages = _load_pages()
+    rnd = random.Random(seed)
+
+    async def handle(request):
+        delay = latency + rnd.uniform(0, jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if rnd.random() < error_rate:
+            return web.Response(status=503, text="Injected error")
+        body = pages.get(request.match_info["name"])
+        if body is None:
+            return web.Response(status=404, text="Not found")
+        return web.Response(body=body, content_type="text/html", charset="utf-8")
+
+    async def start():
+        app = web.Application()
+        app.router.add_get("/wiki/{name}", handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        conn.send(runner.addresses[0][1])
+        await asyncio.Event().wait()
+
+    asyncio.run(start())
+
+
+class ReplayServer:
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, seed=0):
+        self._args = (latency, jitter, error_rate, seed)
+        self._process = None
+        self.port = None
+
+    def __enter__(self):
+        parent_conn, child_conn = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(
+            target=_serve, args=(child_conn,) + self._args, daemon=True
+        )
+        self._process.start()
+        if not parent_conn.poll(30):
+            self._process.terminate()
+            raise RuntimeError("Replay server did not start")
+        self.port = parent_conn.recv()
+        return self
+
+    def __exit__(self, *exc):
+        self._process.terminate()
+        self._process.join()
+
+    def url(self, name):
+        return f"http://127.0.0.1:{self.port}/wiki/{quote(name, safe='/,()')}"
+
+
+class TimedParseExecutor:
+    """Wraps a parse executor and records the duration of every parse"""
+
+    def __init__(self, executor):
+        self._executor = executor
+        self.durations = []
+
+    async def parse(self, content, url, encoding=None):
+        start = time.perf_counter()
+        try:
+            return await self._executor.parse(content, url, encoding)
+        finally:
+            self.durations.append(time.perf_counter() - start)
+
+    def shutdown(self):
+        self._executor.shutdown()
+
+
+def _fetch_trace(durations):
+    """Time from sending a request to getting the response headers"""
+
+    async def on_request_start(session, ctx, params):
+        ctx.start = time.perf_counter()
+
+    async def on_request_end(session, ctx, params):
+        durations.append(time.perf_counter() - ctx.start)
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_end.append(on_request_end)
+    return trace_config
+
+
+def _usage():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime, children.ru_utime + children.ru_stime
+
+
+def bench_crawl(args):
+    fetch_durations = []
+    metrics = Metrics()
+    parser = PARSE_ENGINES[args.engine](None)
+    logger = logging.getLogger("Benchmark")
+
+    with ReplayServer(args.latency, args.jitter, args.error_rate, args.seed) as server, \
+            tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, "result.jsonl")
+
+        async def crawl():
+            if args.parse_workers > 0:
+                executor = ProcessParseExecutor(parser, workers=args.parse_workers)
+            else:
+                executor = InlineParseExecutor(parser)
+            executor = TimedParseExecutor(executor)
+            runner = AsyncRunner(
+                parser,
+                FileSink(output),
+                logger,
+                [server.url(SEED_PAGE)],
+                rate=args.rate,
+                burst=args.burst,
+                max_parallel=args.max_parallel,
+                min_parallel=args.min_parallel if args.adaptive else None,
+                max_tries=args.max_tries,
+                parse_executor=executor,
+                streaming=args.streaming,
+                retry_base_delay=args.retry_delay,
+                trace_configs=[_fetch_trace(fetch_durations)],
+                metrics=metrics,
+            )
+            try:
+                await runner.run()
+            finally:
+                executor.shutdown()
+            return executor.durations
+
+        if args.trace_malloc:
+            tracemalloc.start()
+        cpu_start, children_cpu_start = _usage()
+        start = time.perf_counter()
+        parse_durations = asyncio.run(crawl())
+        duration = time.perf_counter() - start
+        cpu_end, children_cpu_end = _usage()
+        traced_peak = None
+        if args.trace_malloc:
+            traced_peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        records = list(FileSink.read(output))
+
+    errors = sum(1 for record in records if "error" in record)
+    return {
+        "pages": len(records),
+        "errors": errors,
+        "requests": len(fetch_durations),
+        "duration": duration,
+        "pages_per_sec": len(records) / duration if duration else None,
+        "fetch": _percentiles(fetch_durations),
+        "parse": _percentiles(parse_durations),
+        "stages": {
+            stage: {
+                "count": timer.count,
+                "mean": timer.total / timer.count,
+                "p95": timer.quantile(0.95),
+            }
+            for stage, timer in metrics.timers.items()
+            if timer.count
+        },
+        "cpu_time": cpu_end - cpu_start,
+        "children_cpu_time": children_cpu_end - children_cpu_start,
+        #   ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "traced_peak_mb": traced_peak / 1024**2 if traced_peak is not None else None,
+    }
+
+
+def _document(parser, content):
+    if isinstance(parser, LxmlSelectorParser):
+        root = lxml.html.document_fromstring(content, parser=_HTML_PARSER)
+        infobox = root.find_class("infobox")
+        return root, infobox[0].get("data-name") if infobox else None
+
+    index = PageIndex(BeautifulSoup(content, parser._builder))
+    return index, index.infobox.get("data-name") if index.infobox else None
+
+
+def _allocated(func):
+    """Peak bytes allocated while func runs, as seen by tracemalloc"""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _time(func, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def bench_parse(args):
+    """Time tree building and the _*_parse method matching each fixture"""
+    parser = PARSE_ENGINES[args.engine](None)
+    pages = _load_pages()
+    #   Player pages are checked against the teams found on the tournament page
+    parser.parse(pages[SEED_PAGE], f"http://localhost/wiki/{SEED_PAGE}")
+
+    results = {}
+    for name, content in pages.items():
+        url = f"http://localhost/wiki/{quote(name, safe='/,()')}"
+        document, data_name = _document(parser, content)
+        kind = parser.rules.page_kind(data_name) if data_name else None
+        if kind is None:
+            continue
+
+        extract = {
+            "main_page": lambda: parser._main_page_parse(document),
+            "team": lambda: parser._team_parse(document),
+            "player": lambda: parser._player_parse(document, url),
+        }[kind]
+        try:
+            extract()
+        except Exception as e:
+            results[name] = {"kind": kind, "error": str(e)}
+            continue
+
+        results[name] = {
+            "kind": kind,
+            "size": len(content),
+            "tree": _percentiles(_time(lambda: _document(parser, content), args.repeat)),
+            "extract": _percentiles(_time(extract, args.repeat)),
+            #   The whole page path: bytes as read from the response to the result
+            "allocated": _allocated(lambda: parser.parse(content, url, "utf-8")),
+        }
+
+    by_kind = {}
+    allocated = []
+    for result in results.values():
+        if "extract" in result:
+            by_kind.setdefault(result["kind"], []).append(result["extract"]["p50"])
+            allocated.append(result["allocated"] / result["size"])
+    return {
+        "fixtures": results,
+        "extract_p50_by_kind": {kind: statistics.mean(v) for kind, v in by_kind.items()},
+        "allocated_per_page_byte": statistics.mean(allocated) if allocated else None,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _ms(stats, key):
+    return f"{stats[key] * 1000:.1f}ms" if key in stats else "-"
+
+
+def print_report(report):
+    crawl = report.get("crawl")
+    if crawl is not None:
+        print(
+            f"Crawl: {crawl['pages']} pages ({crawl['errors']} errors, {crawl['requests']} requests) "
+            f"in {crawl['duration']:.2f}s, {crawl['pages_per_sec']:.1f} pages/s"
+        )
+        for name in ("fetch", "parse"):
+            stats = crawl[name]
+            print(
+                f"  {name}: p50 {_ms(stats, 'p50')}, p95 {_ms(stats, 'p95')}, p99 {_ms(stats, 'p99')}"
+            )
+        print(
+            "  stages (mean): "
+            + ", ".join(f"{stage} {_ms(stats, 'mean')}" for stage, stats in crawl["stages"].items())
+        )
+        print(
+            f"  cpu {crawl['cpu_time']:.2f}s (+{crawl['children_cpu_time']:.2f}s in children), "
+            f"peak rss {crawl['peak_rss_mb']:.1f}MB"
+        )
+        if crawl["traced_peak_mb"] is not None:
+            print(f"  peak traced allocations {crawl['traced_peak_mb']:.1f}MB")
+
+    parse = report.get("parse")
+    if parse is not None:
+        print("Parse (p50 per fixture):")
+        for name, result in parse["fixtures"].items():
+            if "error" in result:
+                print(f"  {result['kind']:9} {name}: {result['error']}")
+                continue
+            print(
+                f"  {result['kind']:9} {name}: tree {_ms(result['tree'], 'p50')}, "
+                f"extract {_ms(result['extract'], 'p50')}, "
+                f"allocated {result['allocated'] / 1024**2:.1f}MB"
+            )
+        for kind, p50 in parse["extract_p50_by_kind"].items():
+            print(f"  mean extract p50 for {kind}: {p50 * 1000:.2f}ms")
+        if parse["allocated_per_page_byte"] is not None:
+            print(f"  mean peak allocation per page byte: {parse['allocated_per_page_byte']:.1f}")
+
+
+def parse_args():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--engine", choices=sorted(PARSE_ENGINES), default="bs4")
+    arg_parser.add_argument("--latency", type=float, default=0.0, help="Server delay per response in seconds")
+    arg_parser.add_argument("--jitter", type=float, default=0.0, help="Random extra delay up to that many seconds")
+    arg_parser.add_argument("--error-rate", type=float, default=0.0, help="Share of responses answered with 503")
+    arg_parser.add_argument("--seed", type=int, default=0, help="Seed of the latency and error injection")
+    arg_parser.add_argument("--rate", type=float, default=1000)
+    arg_parser.add_argument("--burst", type=int, default=10)
+    arg_parser.add_argument("--max-parallel", type=int, default=10)
+    arg_parser.add_argument("--min-parallel", type=int, default=1)
+    arg_parser.add_argument("--adaptive", action="store_true", help="Let the runner adjust parallel downloads")
+    arg_parser.add_argument("--max-tries", type=int, default=5)
+    arg_parser.add_argument("--retry-delay", type=float, default=0.1)
+    arg_parser.add_argument("--parse-workers", type=int, default=0)
+    arg_parser.add_argument("--streaming", action="store_true")
+    arg_parser.add_argument("--repeat", type=int, default=20, help="Runs of every parse microbenchmark")
+    arg_parser.add_argument(
+        "--trace-malloc",
+        action="store_true",
+        help="Trace allocations during the crawl (slower, reports the peak)",
+    )
+    arg_parser.add_argument("--skip-crawl", action="store_true")
+    arg_parser.add_argument("--skip-parse", action="store_true")
+    arg_parser.add_argument(
+        "--output",
+        default=None,
+        help="JSON file for the results (default - benchmarks/<timestamp>.json)",
+    )
+    arg_parser.add_argument("--verbose", action="store_true", help="Keep the crawler INFO logs")
+    return arg_parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(
+        format="[%(asctime)s %(name)s %(levelname)s: %(message)s]",
+        datefmt="%d-%m-%y %H:%M:%S",
+        level="INFO" if args.verbose else "CRITICAL",
+    )
+
+    started = DT.datetime.now()
+    report = {
+        "started": started.isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "config": vars(args),
+    }
+    if not args.skip_crawl:
+        report["crawl"] = bench_crawl(args)
+    if not args.skip_parse:
+        report["parse"] = bench_parse(args)
+
+    print_report(report)
+
+    output = args.output
+    if output is None:
+        output = os.path.join(ROOT, "benchmarks", started.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,7 @@
+from collections import defaultdict
 import json
 import sys
 
-def load_result(path_to_file):
-    with open(path_to_file) as f:
-        result = {}
-        for elem in map(lambda x: json.loads(x), f):
-            cur_url = elem.get('url')
-            if cur_url is None:
-                raise RuntimeError('Result element has to include url field')
-            result[cur_url] = elem
-        return result
-
-
-if len(sys.argv) != 3:
-    raise ValueError(f'Usage: {sys.argv[0]} <path to expected result> <path to real result>')
-
-
-expected = load_result(sys.argv[1])
-real = load_result(sys.argv[2])
-
 fields_to_compare = [
     'name',
     'height',
@@ -34,11 +17,88 @@ fields_to_compare = [
     'birth',
 ]
 
-for url, expected_value in expected.items():
-    real_value = real.get(url)
-    if real_value is None:
-        raise RuntimeError(f'Real result doesn\'t contain element for url {url}')
-    for field in fields_to_compare:
-        expected_field_value = expected_value.get(field)
-        real_field_value = real_value.get(field)
-        assert expected_field_value == real_field_value, f'URL: {url}. Expected value for field {field} = {expected_field_value} while real is {real_field_value}'
\ No newline at end of file
+EXAMPLES_PER_FIELD = 5
+
+
+def read_result(path_to_file):
+    with open(path_to_file, encoding='utf-8') as f:
+        for elem in map(lambda x: json.loads(x), f):
+            cur_url = elem.get('url')
+            if cur_url is None:
+                raise RuntimeError('Result element has to include url field')
+            yield cur_url, elem
+
+
+def index_result(path_to_file):
+    """Keep only the compared fields of every record, keyed by url"""
+    return {
+        url: tuple(elem.get(field) for field in fields_to_compare)
+        for url, elem in read_result(path_to_file)
+    }
+
+
+def compare(expected, path_to_real):
+    """Stream the real result against the expected index.
+
+    Returns the number of real records and {url: [(field, expected, real)]}
+    for every expected url found in the real result. As with a dict of the
+    real result, the last record for a url is the one that counts.
+    """
+    real_records = 0
+    mismatches = {}
+    for url, elem in read_result(path_to_real):
+        real_records += 1
+        expected_values = expected.get(url)
+        if expected_values is None:
+            continue
+        mismatches[url] = [
+            (field, expected_value, elem.get(field))
+            for field, expected_value in zip(fields_to_compare, expected_values)
+            if expected_value != elem.get(field)
+        ]
+    return real_records, mismatches
+
+
+def report(expected, real_records, mismatches):
+    missing = [url for url in expected if url not in mismatches]
+    by_field = defaultdict(list)
+    for url, diffs in mismatches.items():
+        for field, expected_value, real_value in diffs:
+            by_field[field].append((url, expected_value, real_value))
+    bad_urls = sum(1 for diffs in mismatches.values() if diffs)
+
+    print(f'Expected records: {len(expected)}, real records: {real_records}')
+    print(f'Matched: {len(expected) - len(missing) - bad_urls}, mismatched: {bad_urls}, missing: {len(missing)}')
+
+    if missing:
+        print(f'Real result doesn\'t contain elements for {len(missing)} urls:')
+        for url in missing:
+            print(f'  {url}')
+
+    if by_field:
+        print('Mismatches by field:')
+        for field in fields_to_compare:
+            diffs = by_field.get(field)
+            if not diffs:
+                continue
+            print(f'  {field}: {len(diffs)}')
+            for url, expected_value, real_value in diffs[:EXAMPLES_PER_FIELD]:
+                print(f'    URL: {url}. Expected {expected_value} while real is {real_value}')
+            if len(diffs) > EXAMPLES_PER_FIELD:
+                print(f'    ... and {len(diffs) - EXAMPLES_PER_FIELD} more')
+
+    return not missing and not by_field
+
+
+def main():
+    if len(sys.argv) != 3:
+        raise ValueError(f'Usage: {sys.argv[0]} <path to expected result> <path to real result>')
+
+    expected = index_result(sys.argv[1])
+    real_records, mismatches = compare(expected, sys.argv[2])
+    if not report(expected, real_records, mismatches):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()